@@ -0,0 +1,103 @@
+# benchmark.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Measures how fast the game engine plays quiet (-q) games, in moves per second,
+once for every engine configuration, so that they can be compared:
+
+  python benchmark.py
+  python benchmark.py -l mediumClassic -p LeftTurnAgent -n 10
+
+Every configuration plays the same games from the same random seed.
+"""
+
+from optparse import OptionParser
+import contextlib
+import io
+import random
+import sys
+import time
+
+from game import Game, SAFE_COPY, ZERO_COPY
+import layout
+import pacman
+import textDisplay
+
+# The configurations measured, as (name, extra arguments to runGames,
+# whether Game may use its headless turn loop)
+CONFIGURATIONS = [
+    ('guarded loop, safe-copy', {'observationMode': SAFE_COPY}, False),
+    ('guarded loop, zero-copy', {'observationMode': ZERO_COPY}, False),
+    ('headless loop, safe-copy', {'observationMode': SAFE_COPY}, True),
+    ('headless loop, zero-copy', {'observationMode': ZERO_COPY}, True),
+]
+
+
+def runBenchmark(layoutName, pacmanAgent, ghostAgents, numGames, seed, runGamesArgs, allowHeadless):
+    """
+    Plays numGames quiet games and returns (number of moves, seconds).
+    """
+    random.seed(seed)
+    gameLayout = layout.getLayout(layoutName)
+    Game.allowHeadless = allowHeadless
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            games = pacman.runGames(gameLayout, -1, pacmanAgent, ghostAgents,
+                                    textDisplay.NullGraphics(), numGames, False,
+                                    **runGamesArgs)
+    finally:
+        Game.allowHeadless = True
+    seconds = time.perf_counter() - start
+    return sum([len(game.moveHistory) for game in games]), seconds
+
+
+def readCommand(argv):
+    parser = OptionParser(__doc__)
+    parser.add_option('-l', '--layout', dest='layout', default='smallClassic',
+                      help=pacman.default('the LAYOUT_FILE to play on'), metavar='LAYOUT_FILE')
+    parser.add_option('-p', '--pacman', dest='pacman', default='GreedyAgent',
+                      help=pacman.default('the Pacman agent TYPE'), metavar='TYPE')
+    parser.add_option('-g', '--ghosts', dest='ghost', default='RandomGhost',
+                      help=pacman.default('the ghost agent TYPE'), metavar='TYPE')
+    parser.add_option('-k', '--numghosts', type='int', dest='numGhosts', default=4,
+                      help=pacman.default('the maximum number of ghosts to use'))
+    parser.add_option('-n', '--numGames', type='int', dest='numGames', default=20,
+                      help=pacman.default('the number of GAMES per configuration'), metavar='GAMES')
+    parser.add_option('--seed', type='int', dest='seed', default=188,
+                      help=pacman.default('the random seed every configuration starts from'))
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    pacmanAgent = pacman.loadAgent(options.pacman, True)()
+    ghostType = pacman.loadAgent(options.ghost, True)
+    ghostAgents = [ghostType(i + 1) for i in range(options.numGhosts)]
+
+    print('%s, %s, %d games per configuration' %
+          (options.layout, options.pacman, options.numGames))
+    baseline = None
+    for name, runGamesArgs, allowHeadless in CONFIGURATIONS:
+        moves, seconds = runBenchmark(options.layout, pacmanAgent, ghostAgents,
+                                      options.numGames, options.seed, runGamesArgs,
+                                      allowHeadless)
+        rate = moves / seconds
+        if baseline == None:
+            baseline = rate
+        print('%-26s %7d moves %7.2fs %9.0f moves/s  x%.2f' %
+              (name, moves, seconds, rate, rate / baseline))
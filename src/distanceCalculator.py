@@ -0,0 +1,346 @@
+# distanceCalculator.py
+# ---------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Maze distances between every pair of open cells of a layout, computed once
+with a breadth first search from every cell.
+
+The distances are kept as a matrix of unsigned 16 bit ints and saved in
+DISTANCE_CACHE_DIR, under the user's cache directory, by the layout's content
+hash.  Later runs map the saved
+file into memory instead of searching again, so looking a distance up costs
+two dictionary lookups and an index.
+
+  distancer = getDistancer(gameState.data.layout)
+  distancer.getDistance((1, 1), (5, 3))
+
+A layout with more than MAX_TABLE_CELLS open cells is too large for the
+matrix.  Its distances are searched one source cell at a time instead, when
+first asked for, and the most recently used of those rows are kept.
+
+A DistanceField holds the distances from every cell to the nearest of a
+changing set of cells instead, such as the remaining food.
+"""
+
+from array import array
+import mmap
+import os
+import struct
+import tempfile
+
+import util
+
+
+def _userCacheDir():
+    """
+    The user's cache directory: $XDG_CACHE_HOME, else ~/.cache, else the
+    temporary directory if there is no home directory.
+    """
+    cacheHome = os.environ.get('XDG_CACHE_HOME')
+    if not cacheHome:
+        home = os.path.expanduser('~')
+        if home == '~':
+            return tempfile.gettempdir()
+        cacheHome = os.path.join(home, '.cache')
+    return cacheHome
+
+
+DISTANCE_CACHE_DIR = os.path.join(_userCacheDir(), 'pacman', 'distances')
+UNREACHABLE = 0xffff
+# The largest layout, in open cells, whose distance matrix is computed: 8MB
+MAX_TABLE_CELLS = 2048
+# Distances in the rows of larger layouts, which may not fit in 16 bits
+_ROW_UNREACHABLE = 0xffffffff
+
+# Cache files: magic, number of cells and a byte order check, in native order,
+# followed by the number of cells squared distances
+_CACHE_HEADER = struct.Struct('=8sII')
+_CACHE_MAGIC = b'PACDIST1'
+_BYTE_ORDER_CHECK = 1
+
+_DISTANCERS = {}
+
+
+def getDistancer(layout):
+    """
+    Returns the Distancer of a layout, shared by every caller in the process.
+    """
+    distancer = _DISTANCERS.get(layout.contentHash)
+    if distancer == None:
+        distancer = _DISTANCERS[layout.contentHash] = Distancer(layout)
+    return distancer
+
+
+class Distancer:
+    """
+    All-pairs maze distances for one layout, between the node ids of its
+    LayoutGraph; self.cellIds maps a position to its node.
+
+    For layouts of more than MAX_TABLE_CELLS cells self.distances is None,
+    and self.rows maps a source node to the distances from it, oldest first,
+    holding at most as many distances as the largest matrix.
+    """
+
+    def __init__(self, layout, cacheDir=DISTANCE_CACHE_DIR):
+        self.layout = layout
+        self.graph = layout.graph
+        self.cells = self.graph.positions
+        if len(self.cells) > MAX_TABLE_CELLS:
+            self.distances = None
+            self.rows = {}
+            self.maxRows = max(1, MAX_TABLE_CELLS * MAX_TABLE_CELLS // len(self.cells))
+            return
+        self.cellIds = dict([(cell, i) for i, cell in enumerate(self.cells)])
+        self.cacheFile = None
+        if cacheDir != None:
+            self.cacheFile = os.path.join(cacheDir, layout.contentHash + '.dist')
+        self.distances = self._loadDistances()
+        if self.distances == None:
+            self.distances = self._computeDistances()
+            self._saveDistances()
+
+    def getDistance(self, pos1, pos2):
+        """
+        The number of moves between two open cells, or None if there is no
+        path between them.
+        """
+        if self.distances == None:
+            return self._rowDistance(self.graph.getId(pos1), self.graph.getId(pos2))
+        numCells = len(self.cells)
+        distance = self.distances[self.cellIds[pos1] * numCells + self.cellIds[pos2]]
+        if distance == UNREACHABLE:
+            return None
+        return distance
+
+    def getNodeDistance(self, node1, node2):
+        """
+        The distance between two LayoutGraph nodes, or None if there is no
+        path.
+        """
+        if self.distances == None:
+            return self._rowDistance(node1, node2)
+        distance = self.distances[node1 * len(self.cells) + node2]
+        if distance == UNREACHABLE:
+            return None
+        return distance
+
+    def _rowDistance(self, node1, node2):
+        # Distances are symmetric, so a row kept for either end will do
+        if node2 in self.rows:
+            distance = self._getRow(node2)[node1]
+        else:
+            distance = self._getRow(node1)[node2]
+        if distance == _ROW_UNREACHABLE:
+            return None
+        return distance
+
+    def _getRow(self, source):
+        row = self.rows.get(source)
+        if row == None:
+            if len(self.rows) >= self.maxRows:
+                del self.rows[next(iter(self.rows))]
+            row = self._searchFrom(source)
+        else:
+            # Move the row to the back, as the most recently used
+            del self.rows[source]
+        self.rows[source] = row
+        return row
+
+    def _searchFrom(self, source):
+        "Breadth first search from node source; returns the row of distances"
+        offsets, neighbors = self.graph.offsets, self.graph.neighbors
+        distances = array('I', [_ROW_UNREACHABLE]) * len(self.cells)
+        distances[source] = 0
+        frontier = [source]
+        distance = 0
+        while frontier:
+            distance += 1
+            nextFrontier = []
+            for cell in frontier:
+                for neighbor in neighbors[offsets[cell]:offsets[cell + 1]]:
+                    if distances[neighbor] == _ROW_UNREACHABLE:
+                        distances[neighbor] = distance
+                        nextFrontier.append(neighbor)
+            frontier = nextFrontier
+        return distances
+
+    def _computeDistances(self):
+        numCells = len(self.cells)
+        offsets, neighbors = self.graph.offsets, self.graph.neighbors
+        distances = array('H', [UNREACHABLE]) * (numCells * numCells)
+        for source in range(numCells):
+            row = source * numCells
+            distances[row + source] = 0
+            frontier = [source]
+            distance = 0
+            while frontier:
+                distance += 1
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbor in neighbors[offsets[cell]:offsets[cell + 1]]:
+                        if distances[row + neighbor] == UNREACHABLE:
+                            distances[row + neighbor] = distance
+                            nextFrontier.append(neighbor)
+                frontier = nextFrontier
+        return distances
+
+    def _loadDistances(self):
+        """
+        Maps the cached distances into memory, or returns None if there is no
+        usable cache file.
+        """
+        if self.cacheFile == None or not os.path.exists(self.cacheFile):
+            return None
+        numCells = len(self.cells)
+        try:
+            f = open(self.cacheFile, 'rb')
+            try:
+                cache = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            finally:
+                f.close()
+        except (OSError, ValueError):
+            return None
+        if len(cache) != _CACHE_HEADER.size + 2 * numCells * numCells or \
+                _CACHE_HEADER.unpack_from(cache) != (_CACHE_MAGIC, numCells, _BYTE_ORDER_CHECK):
+            cache.close()
+            return None
+        return memoryview(cache)[_CACHE_HEADER.size:].cast('H')
+
+    def _saveDistances(self):
+        if self.cacheFile == None:
+            return
+        temporaryFile = '%s.%d.tmp' % (self.cacheFile, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(self.cacheFile)):
+                os.makedirs(os.path.dirname(self.cacheFile))
+            f = open(temporaryFile, 'wb')
+            try:
+                f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, len(self.cells), _BYTE_ORDER_CHECK))
+                self.distances.tofile(f)
+            finally:
+                f.close()
+            os.replace(temporaryFile, self.cacheFile)
+        except OSError:
+            # The cache is only an optimization; carry on without it
+            if os.path.exists(temporaryFile):
+                os.remove(temporaryFile)
+
+
+class DistanceField:
+    """
+    The maze distance from every open cell of a layout to the nearest of a
+    set of source cells, such as the food, found by one breadth first search
+    from all the sources at once.  Removing a source repairs only the cells
+    whose distances went through it.
+
+      distances[id]   for LayoutGraph node id; UNREACHABLE if no source can
+                      be reached from it
+    """
+
+    def __init__(self, layout, sources):
+        self.layout = layout
+        self.graph = layout.graph
+        if len(self.graph) >= UNREACHABLE:
+            raise Exception('Layout too large for 16 bit maze distances')
+        self.sources = set([self.graph.getId(source) for source in sources])
+        self.distances = array('H', [UNREACHABLE]) * len(self.graph)
+        frontier = sorted(self.sources)
+        for source in frontier:
+            self.distances[source] = 0
+        self._spread(frontier)
+
+    def _spread(self, frontier):
+        distances, offsets, neighbors = self.distances, self.graph.offsets, self.graph.neighbors
+        distance = 0
+        while frontier:
+            distance += 1
+            nextFrontier = []
+            for cell in frontier:
+                for neighbor in neighbors[offsets[cell]:offsets[cell + 1]]:
+                    if distances[neighbor] == UNREACHABLE:
+                        distances[neighbor] = distance
+                        nextFrontier.append(neighbor)
+            frontier = nextFrontier
+
+    def getDistance(self, position):
+        "The distance from position to the nearest source, or None if there is none"
+        distance = self.distances[self.graph.getId(position)]
+        if distance == UNREACHABLE:
+            return None
+        return distance
+
+    def removeSource(self, position):
+        """
+        Stops treating position as a source.  The cells left without a
+        shortest path to another source are found outwards from it, layer by
+        layer, and only those are searched again, from the cells around them.
+        """
+        source = self.graph.getId(position)
+        if source not in self.sources:
+            return
+        self.sources.remove(source)
+        distances, offsets, neighbors = self.distances, self.graph.offsets, self.graph.neighbors
+
+        # A cell is cut off when all its neighbours one step nearer are
+        affected = set([source])
+        layer = [source]
+        while layer:
+            nextLayer = []
+            for cell in layer:
+                for neighbor in neighbors[offsets[cell]:offsets[cell + 1]]:
+                    if neighbor in affected or distances[neighbor] != distances[cell] + 1:
+                        continue
+                    for other in neighbors[offsets[neighbor]:offsets[neighbor + 1]]:
+                        if distances[other] == distances[cell] and other not in affected:
+                            break
+                    else:
+                        affected.add(neighbor)
+                        nextLayer.append(neighbor)
+            layer = nextLayer
+
+        # Search the cut off cells again, starting from their borders
+        for cell in affected:
+            distances[cell] = UNREACHABLE
+        frontier = util.BucketQueue()
+        for cell in affected:
+            best = UNREACHABLE
+            for neighbor in neighbors[offsets[cell]:offsets[cell + 1]]:
+                if neighbor not in affected and distances[neighbor] + 1 < best:
+                    best = distances[neighbor] + 1
+            if best < UNREACHABLE:
+                distances[cell] = best
+                frontier.push(cell, best)
+        while not frontier.isEmpty():
+            cell = frontier.pop()
+            for neighbor in neighbors[offsets[cell]:offsets[cell + 1]]:
+                if distances[cell] + 1 < distances[neighbor]:
+                    distances[neighbor] = distances[cell] + 1
+                    frontier.update(neighbor, distances[neighbor])
+
+    def getPathToNearest(self, position):
+        """
+        Returns the Directions of a shortest path from position to the nearest
+        source, walking downhill through the field, or None if there is none.
+        """
+        cell = self.graph.getId(position)
+        if self.distances[cell] == UNREACHABLE:
+            return None
+        actions = []
+        while self.distances[cell] > 0:
+            for direction, neighbor in self.graph.getSuccessors(cell):
+                if self.distances[neighbor] == self.distances[cell] - 1:
+                    actions.append(direction)
+                    cell = neighbor
+                    break
+        return actions
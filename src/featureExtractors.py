@@ -41,11 +41,18 @@ class CoordinateExtractor(FeatureExtractor):
         feats['action=%s' % action] = 1.0
         return feats
 
-def closestFood(pos, food, walls):
+def closestFood(pos, food, walls, graph=None):
     """
     closestFood -- this is similar to the function that we have
     worked on in the search project; here its all in one place
+
+    If the LayoutGraph is given and pos is an open cell, the search runs
+    over its node ids instead (see closestFoodOnGraph).
     """
+    if graph:
+        start = graph.getId(pos)
+        if start is not None:
+            return closestFoodOnGraph(start, food, graph)
     fringe = [(pos[0], pos[1], 0)]
     expanded = set()
     while fringe:
@@ -63,6 +70,40 @@ def closestFood(pos, food, walls):
     # no food found
     return None
 
+def closestFoodOnGraph(start, food, graph):
+    """
+    The maze distance from LayoutGraph node start to the nearest food, or
+    None if no food can be reached.  The breadth first search goes one
+    distance at a time and keeps its closed set in a bytearray; the food of
+    a BitGrid is tested on its bits directly.
+    """
+    cellIndex, offsets, neighbors = graph.cellIndex, graph.offsets, graph.neighbors
+    bits = getattr(food, 'bits', None)
+    positions = graph.positions
+    expanded = bytearray(len(positions))
+    expanded[start] = 1
+    frontier = [start]
+    dist = 0
+    while frontier:
+        for node in frontier:
+            if bits is not None:
+                if (bits >> cellIndex[node]) & 1:
+                    return dist
+            else:
+                x, y = positions[node]
+                if food[x][y]:
+                    return dist
+        nextFrontier = []
+        for node in frontier:
+            for nbr in neighbors[offsets[node]:offsets[node + 1]]:
+                if not expanded[nbr]:
+                    expanded[nbr] = 1
+                    nextFrontier.append(nbr)
+        frontier = nextFrontier
+        dist += 1
+    # no food found
+    return None
+
 class SimpleExtractor(FeatureExtractor):
     """
     Returns simple features for a basic reflex Pacman:
@@ -76,6 +117,8 @@ class SimpleExtractor(FeatureExtractor):
         # extract the grid of food and wall locations and get the ghost locations
         food = state.getFood()
         walls = state.getWalls()
+        moves = state.getMoveTable()
+        graph = state.getLayoutGraph()
         ghosts = state.getGhostPositions()
 
         features = util.Counter()
@@ -88,13 +131,13 @@ class SimpleExtractor(FeatureExtractor):
         next_x, next_y = int(x + dx), int(y + dy)
 
         # count the number of ghosts 1-step away
-        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls) for g in ghosts)
+        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in moves.getLegalNeighbors(g) for g in ghosts)
 
         # if there is no danger of ghosts then add the food feature
         if not features["#-of-ghosts-1-step-away"] and food[next_x][next_y]:
             features["eats-food"] = 1.0
 
-        dist = closestFood((next_x, next_y), food, walls)
+        dist = closestFood((next_x, next_y), food, walls, graph=graph)
         if dist is not None:
             # make the distance a number less than one otherwise the update
             # will diverge wildly
@@ -25,6 +25,9 @@ import time
 import os
 import traceback
 import sys
+import hashlib
+import struct
+from array import array
 
 #######################
 # Parts worth reading #
@@ -37,6 +40,7 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+    def setTimeBudget(self, budget): # receives the game's util.TimeBudget
     """
 
     def __init__(self, index=0):
@@ -50,6 +54,26 @@ class Agent:
         raiseNotDefined()
 
 
+class AgentHooks:
+    """
+    The methods an agent provides, looked up once instead of on every turn.
+    Each optional hook is the agent's bound method, or None if it has none.
+    """
+    __slots__ = ('agent', 'getAction', 'setTimeBudget', 'registerInitialState',
+                 'observationFunction', 'final', 'startEpisode',
+                 'observeTransition', 'stopEpisode')
+
+    OPTIONAL_HOOKS = ('setTimeBudget', 'registerInitialState',
+                      'observationFunction', 'final', 'startEpisode',
+                      'observeTransition', 'stopEpisode')
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.getAction = getattr(agent, 'getAction', None)
+        for name in AgentHooks.OPTIONAL_HOOKS:
+            setattr(self, name, getattr(agent, name, None))
+
+
 class Directions:
     NORTH = 'North'
     SOUTH = 'South'
@@ -79,7 +103,11 @@ class Configuration:
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are immutable values that may be shared by many states: to
+    move a character, replace its configuration (see generateSuccessor).
     """
+    __slots__ = ('pos', 'direction')
 
     def __init__(self, pos, direction):
         self.pos = pos
@@ -131,6 +159,8 @@ class AgentState:
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer',
+                 'numCarrying', 'numReturned')
 
     def __init__(self, startConfiguration, isPacman):
         self.start = startConfiguration
@@ -180,6 +210,7 @@ class Grid:
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
+    _frozen = False
 
     def __init__(self, width, height, initialValue=False, bitRepresentation=None):
         if initialValue not in [False, True]:
@@ -208,7 +239,7 @@ class Grid:
     def __eq__(self, other):
         if other == None:
             return False
-        return self.data == other.data
+        return list(map(list, self.data)) == list(map(list, other.data))
 
     def __hash__(self):
         # return hash(str(self))
@@ -223,7 +254,7 @@ class Grid:
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.data = [list(x) for x in self.data]
         return g
 
     def deepCopy(self):
@@ -232,8 +263,17 @@ class Grid:
     def shallowCopy(self):
         g = Grid(self.width, self.height)
         g.data = self.data
+        g._frozen = self._frozen
         return g
 
+    def freeze(self):
+        """
+        Makes the grid read-only; copies of it are writable again.
+        """
+        self.data = tuple(tuple(x) for x in self.data)
+        self._frozen = True
+        return self
+
     def count(self, item=True):
         return sum([x.count(item) for x in self.data])
 
@@ -265,7 +305,7 @@ class Grid:
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -296,6 +336,172 @@ class Grid:
         return bools
 
 
+class BitGrid(Grid):
+    """
+    A boolean Grid whose cells are the bits of a single Python int.  Cell (x,y)
+    is bit x * height + y, the same ordering Grid.__hash__ uses, so equal grids
+    hash equally whichever representation they use.
+
+    The number of True cells and the hash are cached, which makes count() and
+    dictionary lookups constant-time.  Because ints are immutable, copies share
+    the bits until one of them is written to.
+    """
+
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+
+        self.width = width
+        self.height = height
+        if initialValue:
+            self.bits = (1 << (width * height)) - 1
+            self._count = width * height
+        else:
+            self.bits = 0
+            self._count = 0
+        self._hash = None
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.width
+        if i < 0 or i >= self.width:
+            raise IndexError('grid index out of range')
+        return _BitGridColumn(self, i * self.height)
+
+    def __setitem__(self, key, item):
+        column = self[key]
+        for y, value in enumerate(item):
+            column[y] = value
+
+    def fromBits(width, height, bits):
+        "Returns a grid whose cells are the given bits"
+        grid = BitGrid(width, height)
+        grid.bits = bits
+        grid._count = bin(bits).count('1')
+        return grid
+    fromBits = staticmethod(fromBits)
+
+    def fromIndices(width, height, indices):
+        "Returns a grid whose True cells are the given cell indices, x * height + y"
+        cells = bytearray((width * height + 7) // 8)
+        for index in indices:
+            cells[index >> 3] |= 1 << (index & 7)
+        return BitGrid.fromBits(width, height, int.from_bytes(cells, 'little'))
+    fromIndices = staticmethod(fromIndices)
+
+    def _set(self, index, value):
+        if self._frozen:
+            raise TypeError('this grid is frozen; write to a copy of it')
+        mask = 1 << index
+        if value:
+            if not self.bits & mask:
+                self.bits |= mask
+                self._count += 1
+                self._hash = None
+        elif self.bits & mask:
+            self.bits ^= mask
+            self._count -= 1
+            self._hash = None
+
+    @property
+    def data(self):
+        "A list-of-lists snapshot of the grid, for code that reads Grid.data"
+        bits, height = self.bits, self.height
+        return [[(bits >> (x * height + y)) & 1 == 1 for y in range(height)]
+                for x in range(self.width)]
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)]
+               for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None:
+            return False
+        if isinstance(other, BitGrid):
+            return (self.bits == other.bits and self.width == other.width
+                    and self.height == other.height)
+        return self.data == list(map(list, other.data))
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.bits)
+        return self._hash
+
+    def copy(self):
+        g = BitGrid.__new__(BitGrid)
+        g.CELLS_PER_INT = self.CELLS_PER_INT
+        g.width = self.width
+        g.height = self.height
+        g.bits = self.bits
+        g._count = self._count
+        g._hash = self._hash
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        # Sharing the int is already free, and writes never leak between copies
+        return self.copy()
+
+    def freeze(self):
+        self._frozen = True
+        return self
+
+    def count(self, item=True):
+        if item == True:
+            return self._count
+        if item == False:
+            return self.width * self.height - self._count
+        return 0
+
+    def asList(self, key=True):
+        bits = self.bits
+        if not key:
+            bits ^= (1 << (self.width * self.height)) - 1
+        height = self.height
+        list = []
+        while bits:
+            lowest = bits & -bits
+            index = lowest.bit_length() - 1
+            list.append((index // height, index % height))
+            bits ^= lowest
+        return list
+
+
+class _BitGridColumn:
+    "The column grid[x] of a BitGrid, so that grid[x][y] reads and writes bits."
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, offset):
+        self.grid = grid
+        self.offset = offset
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if y < 0 or y >= height:
+            raise IndexError('grid index out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if y < 0 or y >= height:
+            raise IndexError('grid index out of range')
+        self.grid._set(self.offset + y, value)
+
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1, 2)):
         return bitRep
@@ -396,19 +602,340 @@ class Actions:
     getSuccessor = staticmethod(getSuccessor)
 
 
+# The cell masks of a MoveTable hold one bit per legal direction
+_DIRECTION_BITS = {Directions.NORTH: 1, Directions.SOUTH: 2, Directions.EAST: 4,
+                   Directions.WEST: 8, Directions.STOP: 16}
+_MOVE_BITS = 15
+_REVERSE_BITS = dict([(direction, _DIRECTION_BITS[Actions.reverseDirection(direction)] & _MOVE_BITS)
+                      for direction in _DIRECTION_BITS])
+# What a mask allows, by mask: the directions in Actions.getPossibleActions
+# order, the (dx, dy) of Actions.getLegalNeighbors, and the (direction,
+# (dx, dy)) moves in the North, South, East, West order of the search problems
+_MASK_ACTIONS = tuple([tuple([direction for direction, vector in Actions._directionsAsList
+                             if mask & _DIRECTION_BITS[direction]]) for mask in range(32)])
+_MASK_NEIGHBORS = tuple([tuple([vector for direction, vector in Actions._directionsAsList
+                               if mask & _DIRECTION_BITS[direction]]) for mask in range(32)])
+_MASK_SUCCESSORS = tuple([tuple([(direction, Actions._directions[direction]) for direction in
+                                 [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+                                 if mask & _DIRECTION_BITS[direction]]) for mask in range(32)])
+
+
+class MoveTable:
+    """
+    The legal moves out of every cell of a wall grid, compiled once.  Walls
+    never change during a game, so the rules and search problems look moves up
+    here instead of testing walls on every call.  Cells outside the grid count
+    as walls.
+
+    masks[x * height + y] has a bit set for every direction, STOP included,
+    that is legal out of the open cell (x,y) (see _DIRECTION_BITS); walls have
+    no bits set.  The legal actions, neighbours and successors of a cell are
+    read off its mask, and the ghost moves for a heading are the mask without
+    STOP and, unless it is the only way out, without the reverse of the
+    heading.
+    """
+
+    def __init__(self, walls):
+        self.width = walls.width
+        self.height = walls.height
+        north, south, east, west, stop = [_DIRECTION_BITS[direction] for direction in
+                                          [Directions.NORTH, Directions.SOUTH, Directions.EAST,
+                                           Directions.WEST, Directions.STOP]]
+        height = walls.height
+        self.masks = array('B', bytes(walls.width * height))
+        for x in range(walls.width):
+            column = walls[x]
+            westColumn = walls[x - 1] if x > 0 else None
+            eastColumn = walls[x + 1] if x + 1 < walls.width else None
+            for y in range(height):
+                if column[y]:
+                    continue
+                mask = stop
+                if y + 1 < height and not column[y + 1]:
+                    mask |= north
+                if y > 0 and not column[y - 1]:
+                    mask |= south
+                if eastColumn is not None and not eastColumn[y]:
+                    mask |= east
+                if westColumn is not None and not westColumn[y]:
+                    mask |= west
+                self.masks[x * height + y] = mask
+
+    def getMask(self, position):
+        "The direction bits of the integer cell position"
+        x, y = position
+        return self.masks[x * self.height + y]
+
+    def getPossibleActions(self, config):
+        "Same as Actions.getPossibleActions(config, walls)"
+        x, y = config.pos
+        x_int, y_int = int(x + 0.5), int(y + 0.5)
+
+        # In between grid points, all agents must continue straight
+        if (abs(x - x_int) + abs(y - y_int) > Actions.TOLERANCE):
+            return [config.getDirection()]
+        return list(_MASK_ACTIONS[self.masks[x_int * self.height + y_int]])
+
+    def getGhostActions(self, config):
+        """
+        The legal ghost actions: ghosts cannot stop, and cannot turn around
+        unless they reach a dead end.
+        """
+        x, y = config.pos
+        x_int, y_int = int(x + 0.5), int(y + 0.5)
+        if (abs(x - x_int) + abs(y - y_int) > Actions.TOLERANCE):
+            if config.direction == Directions.STOP:
+                return []
+            return [config.direction]
+        legal = self.masks[x_int * self.height + y_int] & _MOVE_BITS
+        reverse = _REVERSE_BITS[config.direction]
+        if legal & reverse and legal != reverse:
+            legal ^= reverse
+        return list(_MASK_ACTIONS[legal])
+
+    def getLegalNeighbors(self, position):
+        "Same as Actions.getLegalNeighbors(position, walls)"
+        x, y = position
+        x, y = int(x + 0.5), int(y + 0.5)
+        return [(x + dx, y + dy) for dx, dy in _MASK_NEIGHBORS[self.masks[x * self.height + y]]]
+
+    def getSuccessors(self, position):
+        """
+        The (direction, (nextx, nexty)) moves out of the integer cell
+        position, in North, South, East, West order
+        """
+        x, y = position
+        return [(direction, (x + dx, y + dy)) for direction, (dx, dy)
+                in _MASK_SUCCESSORS[self.masks[x * self.height + y]]]
+
+
+class LayoutGraph:
+    """
+    The open cells of a wall grid as a graph over dense integer node ids, so
+    that searches can keep closed sets and distance tables in flat arrays
+    instead of dictionaries of (x,y) tuples.  Nodes are numbered column by
+    column, skipping walls.
+
+      positions[id]     the (x,y) of a node
+      cellIndex[id]     x * height + y, which is also the node's bit in a BitGrid
+      ids[x*height+y]   the node of a cell, or -1 for walls
+      offsets, neighbors, directions
+                        the neighbours of node id, in compressed sparse row
+                        form: neighbors[offsets[id]:offsets[id + 1]], reached
+                        by moving in the matching directions entries (North,
+                        South, East, West order, as MoveTable.getSuccessors)
+    """
+
+    def __init__(self, walls, moveTable):
+        self.width = walls.width
+        self.height = walls.height
+        self.positions = [(x, y) for x in range(walls.width)
+                          for y in range(walls.height) if not walls[x][y]]
+        self.cellIndex = array('i', [x * walls.height + y for x, y in self.positions])
+        self.ids = array('i', [-1]) * (walls.width * walls.height)
+        for nodeId, index in enumerate(self.cellIndex):
+            self.ids[index] = nodeId
+
+        self.offsets = array('i', [0])
+        self.neighbors = array('i')
+        self.directions = []
+        for x, y in self.positions:
+            for direction, (nextx, nexty) in moveTable.getSuccessors((x, y)):
+                self.neighbors.append(self.ids[nextx * walls.height + nexty])
+                self.directions.append(direction)
+            self.offsets.append(len(self.neighbors))
+        self.directions = tuple(self.directions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def getId(self, position):
+        "The node of an open cell, or None for walls and cells off the grid"
+        x, y = position
+        x, y = int(x), int(y)
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        nodeId = self.ids[x * self.height + y]
+        if nodeId < 0:
+            return None
+        return nodeId
+
+    def getPosition(self, nodeId):
+        return self.positions[nodeId]
+
+    def getNeighbors(self, nodeId):
+        return self.neighbors[self.offsets[nodeId]:self.offsets[nodeId + 1]]
+
+    def getSuccessors(self, nodeId):
+        "(direction, neighbour) pairs of a node"
+        start, end = self.offsets[nodeId], self.offsets[nodeId + 1]
+        return zip(self.directions[start:end], self.neighbors[start:end])
+
+
+class CorridorGraph:
+    """
+    A LayoutGraph with its corridors contracted: the junctions are the nodes
+    that do not have exactly two neighbours (dead ends and crossings), plus
+    one node of every loop of corridor with no junction on it.  Between them
+    run macro-edges, one each way along every corridor.
+
+      isJunction[id]    whether node id is a junction
+      edges[id]         the edges leaving junction id, [] for other nodes
+      edgeSource[e], edgeTarget[e]
+                        the junctions at either end of edge e
+      edgeCells[e]      the nodes edge e enters, one per move, ending with
+                        its target
+      edgeActions[e]    the directions of those moves
+      edgeReverse[e]    the edge along the same corridor the other way
+      corridor[id]      (e, i) with edgeCells[e][i] == id for a node inside a
+                        corridor, None for junctions
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        numNodes = len(graph)
+        self.isJunction = [len(graph.getNeighbors(node)) != 2 for node in range(numNodes)]
+        self.edges = [[] for node in range(numNodes)]
+        self.edgeSource = []
+        self.edgeTarget = []
+        self.edgeCells = []
+        self.edgeActions = []
+        self.edgeReverse = []
+        self.corridor = [None] * numNodes
+
+        for node in range(numNodes):
+            if self.isJunction[node]:
+                self._addEdges(node)
+        for node in range(numNodes):
+            if self.corridor[node] == None and not self.isJunction[node]:
+                # A loop with no junction: make one
+                self.isJunction[node] = True
+                self._addEdges(node)
+
+        firstEdges = dict([((self.edgeSource[e], self.edgeCells[e][0]), e)
+                           for e in range(len(self.edgeCells))])
+        for e in range(len(self.edgeCells)):
+            cells = self.edgeCells[e]
+            lastStep = cells[-2] if len(cells) > 1 else self.edgeSource[e]
+            self.edgeReverse.append(firstEdges[(self.edgeTarget[e], lastStep)])
+
+    def _addEdges(self, junction):
+        for direction, node in self.graph.getSuccessors(junction):
+            previous = junction
+            cells, actions = [node], [direction]
+            while not self.isJunction[node]:
+                for direction, nextNode in self.graph.getSuccessors(node):
+                    if nextNode != previous:
+                        break
+                previous, node = node, nextNode
+                cells.append(node)
+                actions.append(direction)
+            edge = len(self.edgeCells)
+            self.edges[junction].append(edge)
+            self.edgeSource.append(junction)
+            self.edgeTarget.append(node)
+            self.edgeCells.append(tuple(cells))
+            self.edgeActions.append(tuple(actions))
+            for index in range(len(cells) - 1):
+                if self.corridor[cells[index]] == None:
+                    self.corridor[cells[index]] = (edge, index)
+
+    def __len__(self):
+        return len(self.edgeCells)
+
+
+# The byte buffers of GameStateData.toBytes: a header (first 8 bytes of the
+# layout's content hash, number of agents, win/lose flags, score), one record
+# per agent (position in half cells, direction code, flags, scared timer,
+# food carried and returned), then a bitmask over the layout's capsules and
+# the food grid's bits, both sized by the layout.
+_STATE_HEADER = struct.Struct('<8sBBd')
+_STATE_AGENT = struct.Struct('<hhBBHHH')
+_STATE_WIN = 1
+_STATE_LOSE = 2
+_AGENT_PACMAN = 1
+_AGENT_EATEN = 2
+_AGENT_FLOAT_POSITION = 4
+_NO_CONFIGURATION = 0xff
+_DIRECTIONS = (Directions.NORTH, Directions.SOUTH, Directions.EAST,
+               Directions.WEST, Directions.STOP)
+_DIRECTION_CODES = dict([(direction, code)
+                         for code, direction in enumerate(_DIRECTIONS)])
+
+
+def _halfCells(coordinate):
+    half = int(round(coordinate * 2))
+    if half != coordinate * 2:
+        raise ValueError('Position %r is not on a half cell' % (coordinate,))
+    return half
+
+_ZOBRIST_KEYS = {}
+_ZOBRIST_SALT = b'pacman-zobrist'
+
+
+def _canonicalFeature(feature):
+    "The feature with whole floats as ints, since (1.0, 2.0) == (1, 2)"
+    if isinstance(feature, tuple):
+        return tuple([_canonicalFeature(part) for part in feature])
+    if isinstance(feature, float) and feature.is_integer():
+        return int(feature)
+    return feature
+
+
+def zobristKey(feature):
+    """
+    Returns the 64-bit key of a hashable state feature such as ('food', x, y).
+    The key is a keyed hash of the feature itself, so every process gives a
+    feature the same key whatever order it asks for them in: states hashed
+    in a worker or read back from a pickle still match the parent's.  Hashing
+    states never touches the random stream the game is played with.
+    """
+    key = _ZOBRIST_KEYS.get(feature)
+    if key is None:
+        digest = hashlib.blake2b(repr(_canonicalFeature(feature)).encode(),
+                                 digest_size=8, key=_ZOBRIST_SALT).digest()
+        key = _ZOBRIST_KEYS[feature] = int.from_bytes(digest, 'little')
+    return key
+
+
+def agentZobristKey(agentIndex, agentState):
+    """
+    The key of one agent's position, direction and scared timer.
+    """
+    configuration = agentState.configuration
+    if configuration == None:
+        key = zobristKey(('agent', agentIndex, None, None))
+    else:
+        key = zobristKey(('agent', agentIndex, configuration.pos,
+                          configuration.direction))
+    return key ^ zobristKey(('scared', agentIndex, agentState.scaredTimer))
+
+
 class GameStateData:
+    __slots__ = ('food', 'capsules', 'agentStates', 'layout', '_eaten', 'score',
+                 '_hash', '_ownedAgents', '_foodEaten', '_foodAdded',
+                 '_capsuleEaten', '_agentMoved', '_lose', '_win', 'scoreChange')
 
     def __init__(self, prevState=None):
         """
-        Generates a new data packet by copying information from its predecessor.
+        Generates a new data packet from its predecessor.
+
+        The food grid, the capsule list, the _eaten list and every AgentState
+        are shared with the predecessor (copy-on-write): code that changes one
+        of them must first replace it with a private copy, e.g. through
+        _privateAgentState.  Use deepCopy for a fully independent state.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates(prevState.agentStates)
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._hash = prevState._hash
+        else:
+            self._hash = 0
+        self._ownedAgents = 0
 
         self._foodEaten = None
         self._foodAdded = None
@@ -421,7 +948,10 @@ class GameStateData:
     def deepCopy(self):
         state = GameStateData(self)
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates(self.agentStates)
+        state._eaten = self._eaten[:]
+        state._ownedAgents = (1 << len(self.agentStates)) - 1
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
@@ -441,6 +971,8 @@ class GameStateData:
         if other == None:
             return False
         # TODO Check for type of other
+        if self._hash != other._hash:
+            return False
         if not self.agentStates == other.agentStates:
             return False
         if not self.food == other.food:
@@ -454,14 +986,163 @@ class GameStateData:
     def __hash__(self):
         """
         Allows states to be keys of dictionaries.
+
+        The agents, food and capsules are covered by an incrementally updated
+        Zobrist hash, so only the score has to be mixed in here.
+        """
+        return hash((self._hash, self.score))
+
+    def zobristHash(self):
+        """
+        Computes from scratch the Zobrist hash that the game rules maintain
+        incrementally in self._hash.
+        """
+        h = 0
+        for index, agentState in enumerate(self.agentStates):
+            h ^= agentZobristKey(index, agentState)
+        for x, y in self.food.asList():
+            h ^= zobristKey(('food', x, y))
+        for x, y in self.capsules:
+            h ^= zobristKey(('capsule', x, y))
+        return h
+
+    def toBytes(self):
+        """
+        Serializes the state into a small buffer of fixed size for its layout.
+        The layout itself is only referenced by its content hash; pass it to
+        GameStateData.fromBytes to restore the state.
+        """
+        layout = self.layout
+        flags = 0
+        if self._win:
+            flags |= _STATE_WIN
+        if self._lose:
+            flags |= _STATE_LOSE
+        parts = [_STATE_HEADER.pack(bytes.fromhex(layout.contentHash)[:8],
+                                    len(self.agentStates), flags, self.score)]
+        for agentState, eaten in zip(self.agentStates, self._eaten):
+            agentFlags = 0
+            if agentState.isPacman:
+                agentFlags |= _AGENT_PACMAN
+            if eaten:
+                agentFlags |= _AGENT_EATEN
+            configuration = agentState.configuration
+            if configuration == None:
+                x = y = 0
+                direction = _NO_CONFIGURATION
+            else:
+                x, y = configuration.pos
+                if type(x) == float or type(y) == float:
+                    agentFlags |= _AGENT_FLOAT_POSITION
+                x, y = _halfCells(x), _halfCells(y)
+                direction = _DIRECTION_CODES[configuration.direction]
+            parts.append(_STATE_AGENT.pack(x, y, direction, agentFlags,
+                                           agentState.scaredTimer,
+                                           agentState.numCarrying,
+                                           agentState.numReturned))
+        capsuleMask = 0
+        capsules = set(self.capsules)
+        for i, capsule in enumerate(layout.capsules):
+            if capsule in capsules:
+                capsuleMask |= 1 << i
+        parts.append(capsuleMask.to_bytes((len(layout.capsules) + 7) // 8, 'little'))
+        food = self.food
+        if not isinstance(food, BitGrid):
+            food = BitGrid(food.width, food.height)
+            for x, y in self.food.asList():
+                food[x][y] = True
+        parts.append(food.bits.to_bytes((food.width * food.height + 7) // 8, 'little'))
+        return b''.join(parts)
+
+    def fromBytes(buffer, layout):
+        """
+        Restores a state serialized by toBytes on the given layout.
+        """
+        layoutHash, numAgents, flags, score = _STATE_HEADER.unpack_from(buffer)
+        if layoutHash != bytes.fromhex(layout.contentHash)[:8]:
+            raise Exception('The state was not saved on this layout')
+        state = GameStateData()
+        state.layout = layout
+        state.score = score
+        state._win = bool(flags & _STATE_WIN)
+        state._lose = bool(flags & _STATE_LOSE)
+
+        starts = []
+        numGhosts = 0
+        for isPacman, pos in layout.agentPositions:
+            if not isPacman:
+                if numGhosts == numAgents - 1:
+                    continue
+                numGhosts += 1
+            starts.append(Configuration(pos, Directions.STOP))
+        state.agentStates = []
+        state._eaten = []
+        offset = _STATE_HEADER.size
+        for index in range(numAgents):
+            x, y, direction, agentFlags, scaredTimer, numCarrying, numReturned = \
+                _STATE_AGENT.unpack_from(buffer, offset)
+            offset += _STATE_AGENT.size
+            agentState = AgentState(starts[index], bool(agentFlags & _AGENT_PACMAN))
+            if direction == _NO_CONFIGURATION:
+                agentState.configuration = None
+            else:
+                if agentFlags & _AGENT_FLOAT_POSITION:
+                    pos = (x / 2.0, y / 2.0)
+                else:
+                    pos = (x // 2, y // 2)
+                agentState.configuration = Configuration(pos, _DIRECTIONS[direction])
+            agentState.scaredTimer = scaredTimer
+            agentState.numCarrying = numCarrying
+            agentState.numReturned = numReturned
+            state.agentStates.append(agentState)
+            state._eaten.append(bool(agentFlags & _AGENT_EATEN))
+
+        numBytes = (len(layout.capsules) + 7) // 8
+        capsuleMask = int.from_bytes(buffer[offset:offset + numBytes], 'little')
+        offset += numBytes
+        state.capsules = [capsule for i, capsule in enumerate(layout.capsules)
+                          if capsuleMask & (1 << i)]
+        width, height = layout.width, layout.height
+        numBytes = (width * height + 7) // 8
+        state.food = BitGrid.fromBits(
+            width, height, int.from_bytes(buffer[offset:offset + numBytes], 'little'))
+        state._ownedAgents = (1 << numAgents) - 1
+        state._hash = state.zobristHash()
+        return state
+    fromBytes = staticmethod(fromBytes)
+
+    def fingerprint(self):
+        """
+        A cheap summary of everything an agent could change in place.  The
+        Game compares it before and after handing out a zero-copy observation.
+        """
+        agents = []
+        for agentState in self.agentStates:
+            configuration = agentState.configuration
+            if configuration != None:
+                configuration = (configuration.pos, configuration.direction)
+            agents.append((configuration, agentState.scaredTimer,
+                           agentState.numCarrying, agentState.numReturned))
+        return (self._hash, self.score, hash(self.food), tuple(self.capsules),
+                tuple(agents))
+
+    def _privateAgentState(self, agentIndex):
+        """
+        Returns the agent's state for modification, first replacing it with a
+        private copy if it is still shared with the predecessor state.
         """
-        for i, state in enumerate(self.agentStates):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                # hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113 * hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575)
+        agentState = self.agentStates[agentIndex]
+        if not self._ownedAgents & (1 << agentIndex):
+            agentState = self.agentStates[agentIndex] = agentState.copy()
+            self._ownedAgents |= 1 << agentIndex
+        return agentState
+
+    def _toggleAgentHash(self, agentIndex):
+        """
+        XORs an agent's key into the hash.  Call it once before and once after
+        changing the agent's configuration or scared timer.
+        """
+        self._hash ^= agentZobristKey(agentIndex, self.agentStates[agentIndex])
 
     def __str__(self):
         width, height = self.layout.width, self.layout.height
@@ -524,7 +1205,7 @@ class GameStateData:
         """
         self.food = layout.food.copy()
         #self.capsules = []
-        self.capsules = layout.capsules[:]
+        self.capsules = list(layout.capsules)
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
@@ -540,6 +1221,8 @@ class GameStateData:
             self.agentStates.append(AgentState(
                 Configuration(pos, Directions.STOP), isPacman))
         self._eaten = [False for a in self.agentStates]
+        self._ownedAgents = (1 << len(self.agentStates)) - 1
+        self._hash = self.zobristHash()
 
 
 try:
@@ -548,15 +1231,27 @@ try:
 except:
     _BOINC_ENABLED = False
 
+# How the Game hands the current state to its agents.  SAFE_COPY gives every
+# agent call its own deep copy; ZERO_COPY passes the live state, which agents
+# must then treat as read-only (checked after each call unless run with -O).
+SAFE_COPY = 'safe-copy'
+ZERO_COPY = 'zero-copy'
+OBSERVATION_MODES = (SAFE_COPY, ZERO_COPY)
+
 
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
     """
 
-    def __init__(self, agents, horizon, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False):
+    def __init__(self, agents, horizon, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False, observationMode=SAFE_COPY):
+        if observationMode not in OBSERVATION_MODES:
+            raise Exception('Unknown observation mode: ' + str(observationMode))
         self.agentCrashed = False
         self.agents = agents
+        self.agentHooks = [AgentHooks(agent) for agent in agents]
+        self.timeBudget = TimeBudget()
+        self.recorder = None
         self.display = display
         self.rules = rules
         self.startingIndex = startingIndex
@@ -568,6 +1263,7 @@ class Game:
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
         self.horizon = horizon
+        self.observationMode = observationMode
         import io
         self.agentOutput = [io.StringIO() for agent in agents]
 
@@ -585,6 +1281,9 @@ class Game:
         self.agentCrashed = True
         self.rules.agentCrash(self, agentIndex)
 
+    # Set to False to always play through the guarded turn loop
+    allowHeadless = True
+
     OLD_STDOUT = None
     OLD_STDERR = None
 
@@ -606,10 +1305,51 @@ class Game:
         sys.stdout = OLD_STDOUT
         sys.stderr = OLD_STDERR
 
+    def isHeadless(self):
+        """
+        True if this game can use the fast turn loop: nobody watches it
+        (the display is a null display) and the agents are trusted (no
+        exception catching, timeouts or muting).
+        """
+        if not Game.allowHeadless or self.catchExceptions or self.muteAgents:
+            return False
+        checkNullDisplay = getattr(self.display, 'checkNullDisplay', None)
+        return checkNullDisplay != None and checkNullDisplay()
+
+    def observe(self):
+        """
+        Returns the state to hand to an agent: a private copy in safe-copy
+        mode, the live state itself in zero-copy mode.
+        """
+        if self.observationMode == ZERO_COPY:
+            return self.state
+        return self.state.deepCopy()
+
+    def _observationFingerprint(self):
+        """
+        Records the live state before an agent sees it, so that
+        _checkObservation can tell whether the agent changed it.  Only done in
+        zero-copy mode, and not at all when Python runs with -O.
+        """
+        if __debug__ and self.observationMode == ZERO_COPY:
+            return self.state.data.fingerprint()
+        return None
+
+    def _checkObservation(self, agentIndex, fingerprint):
+        if fingerprint != None:
+            assert self.state.data.fingerprint() == fingerprint, \
+                'Agent %d modified a read-only (zero-copy) observation' % agentIndex
+
     def run(self):
         """
         Main control loop for game play.
         """
+        try:
+            self._run()
+        finally:
+            self.timeBudget.close()
+
+    def _run(self):
         self.display.initialize(self.state.data)
         self.numMoves = 0
 
@@ -625,16 +1365,20 @@ class Game:
                 self.unmute()
                 self._agentCrash(i, quiet=True)
                 return
-            if ("registerInitialState" in dir(agent)):
+            hooks = self.agentHooks[i]
+            if hooks.setTimeBudget != None:
+                hooks.setTimeBudget(self.timeBudget)
+            if hooks.registerInitialState != None:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(
-                            agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
                         try:
-                            start_time = time.time()
-                            timed_func(self.state.deepCopy())
-                            time_taken = time.time() - start_time
+                            start_time = time.monotonic()
+                            fingerprint = self._observationFingerprint()
+                            self.timeBudget.call(self.rules.getMaxStartupTime(i),
+                                                 hooks.registerInitialState, self.observe())
+                            self._checkObservation(i, fingerprint)
+                            time_taken = time.monotonic() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
                             print("Agent %d ran out of time on startup!" %
@@ -648,10 +1392,39 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    fingerprint = self._observationFingerprint()
+                    hooks.registerInitialState(self.observe())
+                    self._checkObservation(i, fingerprint)
                 # TODO: could this exceed the total time
                 self.unmute()
 
+        if self.isHeadless():
+            self._runHeadless()
+        else:
+            self._runGuarded()
+        if self.agentCrashed:
+            return
+
+        # inform a learning agent of the game result
+        for agentIndex, hooks in enumerate(self.agentHooks):
+            if hooks.final != None:
+                try:
+                    self.mute(agentIndex)
+                    hooks.final(self.state)
+                    self.unmute()
+                except Exception as data:
+                    if not self.catchExceptions:
+                        raise
+                    self._agentCrash(agentIndex)
+                    self.unmute()
+                    return
+        self.display.finish()
+
+    def _runGuarded(self):
+        """
+        The turn loop used when agents are untrusted or the game is shown:
+        agents are muted and timed, and every move is displayed.
+        """
         agentIndex = self.startingIndex
         numAgents = len(self.agents)
         timestep = 0
@@ -659,46 +1432,47 @@ class Game:
         while not self.gameOver and (self.horizon < 0 or timestep < self.horizon):
             timestep += 1
             # Fetch the next agent
-            agent = self.agents[agentIndex]
+            hooks = self.agentHooks[agentIndex]
             move_time = 0
             skip_action = False
+            fingerprint = self._observationFingerprint()
             # Generate an observation of the state
-            if 'observationFunction' in dir(agent):
+            if hooks.observationFunction != None:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(
-                            self.rules.getMoveTimeout(agentIndex)))
                         try:
-                            start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            start_time = time.monotonic()
+                            observation = self.timeBudget.call(
+                                self.rules.getMoveTimeout(agentIndex),
+                                hooks.observationFunction, self.observe())
                         except TimeoutFunctionException:
                             skip_action = True
-                        move_time += time.time() - start_time
+                        move_time += time.monotonic() - start_time
                         self.unmute()
                     except Exception as data:
                         self._agentCrash(agentIndex, quiet=False)
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(
-                        self.state.deepCopy())
+                    observation = hooks.observationFunction(self.observe())
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self.observe()
 
             # Solicit an action
             action = None
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(
-                        self.rules.getMoveTimeout(agentIndex)) - int(move_time))
                     try:
-                        start_time = time.time()
+                        start_time = time.monotonic()
                         if skip_action:
                             raise TimeoutFunctionException()
-                        action = timed_func(observation)
+                        action = self.timeBudget.call(
+                            self.rules.getMoveTimeout(agentIndex) - move_time,
+                            hooks.getAction, observation)
+                        self._checkObservation(agentIndex, fingerprint)
                     except TimeoutFunctionException:
                         print("Agent %d timed out on a single move!" %
                               agentIndex, file=sys.stderr)
@@ -707,7 +1481,7 @@ class Game:
                         self.unmute()
                         return
 
-                    move_time += time.time() - start_time
+                    move_time += time.monotonic() - start_time
 
                     if move_time > self.rules.getMoveWarningTime(agentIndex):
                         self.totalAgentTimeWarnings[agentIndex] += 1
@@ -736,7 +1510,8 @@ class Game:
                     self.unmute()
                     return
             else:
-                action = agent.getAction(observation)
+                action = hooks.getAction(observation)
+                self._checkObservation(agentIndex, fingerprint)
             self.unmute()
 
             # Execute the action
@@ -752,6 +1527,8 @@ class Game:
                     return
             else:
                 self.state = self.state.generateSuccessor(agentIndex, action)
+            if self.recorder != None:
+                self.recorder.recordMove(agentIndex, action, self.state)
 
             # Change the display
             self.display.update(self.state.data)
@@ -769,17 +1546,35 @@ class Game:
             if _BOINC_ENABLED:
                 boinc.set_fraction_done(self.getProgress())
 
-        # inform a learning agent of the game result
-        for agentIndex, agent in enumerate(self.agents):
-            if "final" in dir(agent):
-                try:
-                    self.mute(agentIndex)
-                    agent.final(self.state)
-                    self.unmute()
-                except Exception as data:
-                    if not self.catchExceptions:
-                        raise
-                    self._agentCrash(agentIndex)
-                    self.unmute()
-                    return
-        self.display.finish()
+    def _runHeadless(self):
+        """
+        The turn loop for trusted agents and a null display.  It plays exactly
+        the moves _runGuarded would, without muting, timing, display updates
+        or BOINC progress reports.
+        """
+        agentIndex = self.startingIndex
+        numAgents = len(self.agents)
+        horizon = self.horizon
+        agentHooks = self.agentHooks
+        rules = self.rules
+        moveHistory = self.moveHistory
+        recorder = self.recorder
+        timestep = 0
+
+        while not self.gameOver and (horizon < 0 or timestep < horizon):
+            timestep += 1
+            hooks = agentHooks[agentIndex]
+            fingerprint = self._observationFingerprint()
+            if hooks.observationFunction != None:
+                observation = hooks.observationFunction(self.observe())
+            else:
+                observation = self.observe()
+            action = hooks.getAction(observation)
+            self._checkObservation(agentIndex, fingerprint)
+
+            moveHistory.append((agentIndex, action))
+            self.state = self.state.generateSuccessor(agentIndex, action)
+            if recorder != None:
+                recorder.recordMove(agentIndex, action, self.state)
+            rules.process(self.state, self)
+            agentIndex = (agentIndex + 1) % numAgents
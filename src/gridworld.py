@@ -18,6 +18,7 @@ import mdp
 import environment
 import util
 import optparse
+from game import AgentHooks
 
 class Gridworld(mdp.MarkovDecisionProcess):
     """
@@ -348,7 +349,8 @@ def runEpisode(agent, environment, discount, decision, display, message, pause,
     returns = 0
     totalDiscount = 1.0
     environment.reset()
-    if 'startEpisode' in dir(agent): agent.startEpisode()
+    hooks = AgentHooks(agent)
+    if hooks.startEpisode != None: hooks.startEpisode()
     message("BEGINNING EPISODE: "+str(episode)+"\n")
     while True:
 
@@ -375,14 +377,14 @@ def runEpisode(agent, environment, discount, decision, display, message, pause,
                 "\nEnded in state: "+str(nextState)+
                 "\nGot reward: "+str(reward)+"\n")
         # UPDATE LEARNER
-        if 'observeTransition' in dir(agent):
-            agent.observeTransition(state, action, nextState, reward)
+        if hooks.observeTransition != None:
+            hooks.observeTransition(state, action, nextState, reward)
 
         returns += reward * totalDiscount
         totalDiscount *= discount
 
-    if 'stopEpisode' in dir(agent):
-        agent.stopEpisode()
+    if hooks.stopEpisode != None:
+        hooks.stopEpisode()
 
 def parseOptions():
     optParser = optparse.OptionParser()
@@ -0,0 +1,206 @@
+# incrementalSearch.py
+# --------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Incremental shortest paths (D* Lite, Koenig and Likhachev) over the
+LayoutGraph of a layout, for agents that replan as the costs of the board
+change under them.
+
+The planner searches backwards, from a set of goal cells to the start, and
+keeps its g and rhs values between queries.  When the start moves or the
+cost of entering a cell changes, only the values that depend on the change
+are repaired, so replanning costs a small part of a fresh search.
+
+The goals behave as one virtual goal joined to every goal cell at no cost:
+the planner finds the path to the nearest of them.
+
+  planner = DStarLite(gameState.data.layout, start, [goal])
+  action = planner.getNextAction()
+  planner.moveStart(newPosition)
+  planner.setCost(cellNearGhost, 21)
+  action = planner.getNextAction()
+
+Repairs pay off when a change touches a small part of a long plan, such as
+costs moving with the ghosts (see GhostAvoidingSearchAgent and
+replanBenchmark.py).  Goals can be added and removed too, but removing the
+goal a plan leads to invalidates most of it, and costs about as much as a
+fresh search; a shrinking set of goals such as the food is better served by
+a DistanceField (see distanceCalculator.py and ClosestDotSearchAgent).
+"""
+
+import heapq
+
+INFINITY = float('inf')
+
+
+class DStarLite:
+    """
+    A D* Lite planner over the open cells of a layout.  Moving into a cell
+    costs that cell's cost: 1 unless changed with setCost, at least 1 (the
+    Manhattan distance guides the search), and INFINITY for a blocked cell.
+
+      g[id], rhs[id]    the planner's estimates of the cost from node id to
+                        the nearest goal, equal wherever the values are
+                        settled
+      queue             a heap of (key, node) entries, with self.keys holding
+                        the key of every queued node; entries whose key no
+                        longer matches are skipped
+    """
+
+    def __init__(self, layout, start, goals=()):
+        self.graph = layout.graph
+        numNodes = len(self.graph)
+        self.g = [INFINITY] * numNodes
+        self.rhs = [INFINITY] * numNodes
+        self.costs = [1] * numNodes
+        self.goals = set()
+        self.queue = []
+        self.keys = {}
+        self.km = 0
+        self.start = self._node(start)
+        self.expanded = 0
+        for goal in goals:
+            self.addGoal(goal)
+
+    def _node(self, position):
+        node = self.graph.getId(position)
+        if node == None:
+            raise Exception('%s is not an open cell of the layout' % (position,))
+        return node
+
+    def _heuristic(self, node):
+        "The Manhattan distance from the start to node"
+        x1, y1 = self.graph.positions[self.start]
+        x2, y2 = self.graph.positions[node]
+        return abs(x1 - x2) + abs(y1 - y2)
+
+    def _key(self, node):
+        best = min(self.g[node], self.rhs[node])
+        return (best + self._heuristic(node) + self.km, best)
+
+    def _updateNode(self, node):
+        if node not in self.goals:
+            best = INFINITY
+            neighbors = self.graph.getNeighbors(node)
+            for neighbor in neighbors:
+                cost = self.costs[neighbor] + self.g[neighbor]
+                if cost < best:
+                    best = cost
+            self.rhs[node] = best
+        if self.g[node] != self.rhs[node]:
+            key = self._key(node)
+            if self.keys.get(node) != key:
+                self.keys[node] = key
+                heapq.heappush(self.queue, (key, node))
+        elif node in self.keys:
+            del self.keys[node]
+
+    def _topKey(self):
+        queue = self.queue
+        while queue and self.keys.get(queue[0][1]) != queue[0][0]:
+            heapq.heappop(queue)
+        if queue:
+            return queue[0][0]
+        return (INFINITY, INFINITY)
+
+    def computeShortestPath(self):
+        """
+        Settles the values the path from the start depends on.
+        """
+        g, rhs, graph = self.g, self.rhs, self.graph
+        while self._topKey() < self._key(self.start) or rhs[self.start] != g[self.start]:
+            oldKey, node = heapq.heappop(self.queue)
+            del self.keys[node]
+            newKey = self._key(node)
+            if oldKey < newKey:
+                self.keys[node] = newKey
+                heapq.heappush(self.queue, (newKey, node))
+                continue
+            self.expanded += 1
+            if g[node] > rhs[node]:
+                g[node] = rhs[node]
+                for neighbor in graph.getNeighbors(node):
+                    self._updateNode(neighbor)
+            else:
+                g[node] = INFINITY
+                self._updateNode(node)
+                for neighbor in graph.getNeighbors(node):
+                    self._updateNode(neighbor)
+
+    def moveStart(self, position):
+        node = self._node(position)
+        self.km += self._heuristic(node)
+        self.start = node
+
+    def addGoal(self, position):
+        node = self._node(position)
+        if node not in self.goals:
+            self.goals.add(node)
+            self.rhs[node] = 0
+            self._updateNode(node)
+
+    def removeGoal(self, position):
+        node = self._node(position)
+        if node in self.goals:
+            self.goals.remove(node)
+            self._updateNode(node)
+
+    def setCost(self, position, cost):
+        """
+        Sets the cost of moving into the cell at position.
+        """
+        node = self._node(position)
+        if self.costs[node] != cost:
+            self.costs[node] = cost
+            for neighbor in self.graph.getNeighbors(node):
+                self._updateNode(neighbor)
+
+    def getDistance(self):
+        "The cost of the path from the start to the nearest goal; INFINITY if there is none"
+        self.computeShortestPath()
+        return self.g[self.start]
+
+    def getPath(self):
+        """
+        Returns the Directions of a cheapest path from the start to the
+        nearest goal, or None if no goal can be reached.
+        """
+        self.computeShortestPath()
+        if self.g[self.start] == INFINITY:
+            return None
+        actions = []
+        node = self.start
+        while node not in self.goals:
+            direction, node = self._bestMove(node)
+            actions.append(direction)
+        return actions
+
+    def getNextAction(self):
+        """
+        The first Direction of getPath, without walking the rest of the
+        path; None if no goal can be reached or the start is a goal.
+        """
+        self.computeShortestPath()
+        if self.g[self.start] == INFINITY or self.start in self.goals:
+            return None
+        return self._bestMove(self.start)[0]
+
+    def _bestMove(self, node):
+        "(direction, neighbour) of the cheapest move from node towards a goal"
+        bestCost, bestMove = INFINITY, None
+        for direction, neighbor in self.graph.getSuccessors(node):
+            cost = self.costs[neighbor] + self.g[neighbor]
+            if cost < bestCost:
+                bestCost, bestMove = cost, (direction, neighbor)
+        return bestMove
@@ -14,31 +14,75 @@
 
 from util import manhattanDistance
 from game import Grid
+from game import BitGrid
+from game import MoveTable
+from game import LayoutGraph
+from game import CorridorGraph
 import os
 import random
 from functools import reduce
+import hashlib
 
 VISIBILITY_MATRIX_CACHE = {}
+LAYOUT_CACHE = {}
 
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are immutable: the walls and food grids are frozen and the capsule
+    and agent lists are tuples.  Every GameState played on a board shares the
+    same Layout object, so copying a state never copies or re-parses it.
     """
 
-    def __init__(self, layoutText):
+    def __init__(self, layoutText, name=None):
+        self.name = name
         self.width = len(layoutText[0])
         self.height = len(layoutText)
         self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
-        self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.layoutText = tuple(layoutText)
+        # Identifies the board in recordings and caches, whatever its name
+        self.contentHash = hashlib.sha1(
+            '\n'.join(self.layoutText).encode()).hexdigest()
+        self.totalFood = self.food.count()
+        self.walls.freeze()
+        self.food.freeze()
+        self._moveTable = None
+        self._graph = None
+        self._corridors = None
+        self.capsules = tuple(self.capsules)
+        self.agentPositions = tuple(self.agentPositions)
         # self.initializeVisibilityMatrix()
 
+    @property
+    def moveTable(self):
+        "The MoveTable of the walls, compiled the first time it is used"
+        if self._moveTable == None:
+            self._moveTable = MoveTable(self.walls)
+        return self._moveTable
+
+    @property
+    def graph(self):
+        "The LayoutGraph of the walls, built the first time it is used"
+        if self._graph == None:
+            self._graph = LayoutGraph(self.walls, self.moveTable)
+        return self._graph
+
+    @property
+    def corridors(self):
+        """
+        The CorridorGraph of the layout, contracted the first time a search
+        asks for it
+        """
+        if self._corridors == None:
+            self._corridors = CorridorGraph(self.graph)
+        return self._corridors
+
     def getNumGhosts(self):
         return self.numGhosts
 
@@ -97,7 +141,19 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts are immutable, so every copy can be the layout itself
+        return self
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # Pickles (e.g. of states sent between processes) only carry the text,
+        # and unpickling returns the shared Layout for it
+        return (layoutFromText, (self.layoutText,))
 
     def processLayoutText(self, layoutText):
         """
@@ -113,10 +169,14 @@ class Layout:
         Other characters are ignored.
         """
         maxY = self.height - 1
+        self.foodIndices = []
         for y in range(self.height):
             for x in range(self.width):
                 layoutChar = layoutText[maxY - y][x]
                 self.processLayoutChar(x, y, layoutChar)
+        # Setting the food bits one at a time would copy the whole int each time
+        self.food = BitGrid.fromIndices(self.width, self.height, self.foodIndices)
+        del self.foodIndices
         self.agentPositions.sort()
         self.agentPositions = [(i == 0, pos) for i, pos in self.agentPositions]
 
@@ -124,7 +184,7 @@ class Layout:
         if layoutChar == '%':
             self.walls[x][y] = True
         elif layoutChar == '.':
-            self.food[x][y] = True
+            self.foodIndices.append(x * self.height + y)
         elif layoutChar == 'o':
             self.capsules.append((x, y))
         elif layoutChar == 'P':
@@ -154,11 +214,27 @@ def getLayout(name, back=2):
     return layout
 
 
+def layoutFromText(layoutText, name=None):
+    """
+    Returns the shared Layout for a layout text (a list of rows), parsing the
+    text only the first time it is seen.  The name is that of the first
+    layout file the text was loaded from.
+    """
+    key = tuple(layoutText)
+    layout = LAYOUT_CACHE.get(key)
+    if layout == None:
+        layout = LAYOUT_CACHE[key] = Layout(list(key), name)
+    return layout
+
+
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)):
         return None
+    name = os.path.basename(fullname)
+    if name.endswith('.lay'):
+        name = name[:-len('.lay')]
     f = open(fullname)
     try:
-        return Layout([line.strip() for line in f])
+        return layoutFromText([line.strip() for line in f], name)
     finally:
         f.close()
@@ -41,8 +41,11 @@ The keys are 'a', 's', 'd', and 'w' to move (or arrow keys).  Have fun!
 """
 from game import GameStateData
 from game import Game
+from game import OBSERVATION_MODES, SAFE_COPY
 from game import Directions
 from game import Actions
+from game import Configuration
+from game import zobristKey
 from util import nearestPoint
 from util import manhattanDistance
 import util
@@ -77,20 +80,47 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variables count the calls to generateSuccessor and, only when a
+    # grader asks for it, remember the states it was called on
+    numSuccessorsGenerated = 0
+    exploredTracker = None
+
+    def enableExploredTracking(maxSize=100000, sampleRate=1.0):
+        """
+        Starts remembering the states generateSuccessor is called on, for
+        getAndResetExplored.  See ExploredStateTracker for the arguments.
+        """
+        GameState.exploredTracker = ExploredStateTracker(maxSize, sampleRate)
+    enableExploredTracking = staticmethod(enableExploredTracking)
+
+    def disableExploredTracking():
+        GameState.exploredTracker = None
+    disableExploredTracking = staticmethod(disableExploredTracking)
 
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
-        return tmp
+        """
+        Returns the set of states recorded since the last call.  It is always
+        empty unless enableExploredTracking has been called.
+        """
+        tracker = GameState.exploredTracker
+        if tracker == None:
+            return set()
+        return tracker.getAndReset()
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def getAndResetSuccessorCount():
+        """
+        Returns how many successors have been generated since the last call.
+        """
+        tmp = GameState.numSuccessorsGenerated
+        GameState.numSuccessorsGenerated = 0
+        return tmp
+    getAndResetSuccessorCount = staticmethod(getAndResetSuccessorCount)
+
     def getLegalActions(self, agentIndex=0):
         """
         Returns the legal actions for the agent specified.
         """
-#        GameState.explored.add(self)
         if self.isWin() or self.isLose():
             return []
 
@@ -120,8 +150,11 @@ class GameState:
         # Time passes
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
-        else:
-            GhostRules.decrementTimer(state.data.agentStates[agentIndex])
+        elif state.data.agentStates[agentIndex].scaredTimer > 0:
+            ghostState = state.data._privateAgentState(agentIndex)
+            state.data._toggleAgentHash(agentIndex)
+            GhostRules.decrementTimer(ghostState)
+            state.data._toggleAgentHash(agentIndex)
 
         # Resolve multi-agent effects
         GhostRules.checkDeath(state, agentIndex)
@@ -129,8 +162,10 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        GameState.numSuccessorsGenerated += 1
+        if GameState.exploredTracker != None:
+            GameState.exploredTracker.add(self)
+            GameState.exploredTracker.add(state)
         return state
 
     def getLegalPacmanActions(self):
@@ -209,6 +244,30 @@ class GameState:
         """
         return self.data.layout.walls
 
+    def getMoveTable(self):
+        """
+        Returns the MoveTable (in game.py) of the walls: the legal moves out of
+        every cell, compiled once per layout.
+
+        moves = state.getMoveTable()
+        for direction, (nextx, nexty) in moves.getSuccessors((x, y)): ...
+        """
+        return self.data.layout.moveTable
+
+    def getLayoutGraph(self):
+        """
+        Returns the LayoutGraph (in game.py) of the walls: the open cells as
+        integer node ids with their neighbours, compiled once per layout.
+        """
+        return self.data.layout.graph
+
+    def getCorridorGraph(self):
+        """
+        Returns the CorridorGraph (in game.py) of the layout: its LayoutGraph
+        with every corridor contracted into edges between junctions.
+        """
+        return self.data.layout.corridors
+
     def hasFood(self, x, y):
         return self.data.food[x][y]
 
@@ -240,6 +299,23 @@ class GameState:
         state.data = self.data.deepCopy()
         return state
 
+    def toBytes(self):
+        """
+        Returns the state as a small byte buffer, which refers to the layout
+        by its hash instead of containing it.
+        """
+        return self.data.toBytes()
+
+    def fromBytes(buffer, layout):
+        """
+        Restores a state saved by toBytes; the layout must be the one it was
+        played on.
+        """
+        state = GameState()
+        state.data = GameStateData.fromBytes(buffer, layout)
+        return state
+    fromBytes = staticmethod(fromBytes)
+
     def __eq__(self, other):
         """
         Allows two states to be compared.
@@ -269,6 +345,38 @@ class GameState:
 ############################################################################
 
 
+class ExploredStateTracker:
+    """
+    Remembers explored GameStates for graders without keeping every state of a
+    long run alive: once maxSize states are held (None means no limit) further
+    states are only counted in self.dropped, and with a sampleRate below 1 only
+    that fraction of the states is considered at all.
+    """
+
+    def __init__(self, maxSize=100000, sampleRate=1.0):
+        self.maxSize = maxSize
+        self.sampleRate = sampleRate
+        self.states = set()
+        self.dropped = 0
+        # A private generator, so sampling does not change the games played
+        self.random = random.Random(0)
+
+    def add(self, state):
+        if self.sampleRate < 1.0 and self.random.random() >= self.sampleRate:
+            return
+        if self.maxSize != None and len(self.states) >= self.maxSize:
+            if state not in self.states:
+                self.dropped += 1
+            return
+        self.states.add(state)
+
+    def getAndReset(self):
+        tmp = self.states
+        self.states = set()
+        self.dropped = 0
+        return tmp
+
+
 SCARED_TIME = 40    # Moves ghosts are scared
 COLLISION_TOLERANCE = 0.7  # How close ghosts must be to Pacman to kill
 TIME_PENALTY = 1  # Number of points lost each round
@@ -280,14 +388,16 @@ class ClassicGameRules:
     and how the game starts and ends.
     """
 
-    def __init__(self, timeout=30):
+    def __init__(self, timeout=30, moveTimeout=None):
         self.timeout = timeout
+        self.moveTimeout = moveTimeout
 
-    def newGame(self, layout, horizon, pacmanAgent, ghostAgents, display, quiet=False, catchExceptions=False):
+    def newGame(self, layout, horizon, pacmanAgent, ghostAgents, display, quiet=False, catchExceptions=False, observationMode=SAFE_COPY):
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
         initState = GameState()
         initState.initialize(layout, len(ghostAgents))
-        game = Game(agents, horizon, display, self, catchExceptions=catchExceptions)
+        game = Game(agents, horizon, display, self, catchExceptions=catchExceptions,
+                    observationMode=observationMode)
         game.state = initState
         self.initialState = initState.deepCopy()
         self.quiet = quiet
@@ -328,9 +438,11 @@ class ClassicGameRules:
         return self.timeout
 
     def getMoveWarningTime(self, agentIndex):
-        return self.timeout
+        return self.getMoveTimeout(agentIndex)
 
     def getMoveTimeout(self, agentIndex):
+        if self.moveTimeout != None:
+            return self.moveTimeout
         return self.timeout
 
     def getMaxTimeWarnings(self, agentIndex):
@@ -348,7 +460,7 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions(state.getPacmanState().configuration, state.data.layout.walls)
+        return state.data.layout.moveTable.getPossibleActions(state.data.agentStates[0].configuration)
     getLegalActions = staticmethod(getLegalActions)
 
     def applyAction(state, action):
@@ -359,12 +471,14 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data._privateAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector(action, PacmanRules.PACMAN_SPEED)
+        state.data._toggleAgentHash(0)
         pacmanState.configuration = pacmanState.configuration.generateSuccessor(
             vector)
+        state.data._toggleAgentHash(0)
 
         # Eat
         next = pacmanState.configuration.getPosition()
@@ -381,19 +495,24 @@ class PacmanRules:
             state.data.scoreChange += 10
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
+            state.data._hash ^= zobristKey(('food', x, y))
             state.data._foodEaten = position
-            # TODO: cache numFood?
             numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if(position in state.getCapsules()):
+            state.data.capsules = state.data.capsules[:]
             state.data.capsules.remove(position)
+            state.data._hash ^= zobristKey(('capsule', x, y))
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range(1, len(state.data.agentStates)):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                ghostState = state.data._privateAgentState(index)
+                state.data._toggleAgentHash(index)
+                ghostState.scaredTimer = SCARED_TIME
+                state.data._toggleAgentHash(index)
     consume = staticmethod(consume)
 
 
@@ -409,14 +528,7 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState(ghostIndex).configuration
-        possibleActions = Actions.getPossibleActions(
-            conf, state.data.layout.walls)
-        reverse = Actions.reverseDirection(conf.direction)
-        if Directions.STOP in possibleActions:
-            possibleActions.remove(Directions.STOP)
-        if reverse in possibleActions and len(possibleActions) > 1:
-            possibleActions.remove(reverse)
-        return possibleActions
+        return state.data.layout.moveTable.getGhostActions(conf)
     getLegalActions = staticmethod(getLegalActions)
 
     def applyAction(state, action, ghostIndex):
@@ -425,20 +537,23 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data._privateAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0:
             speed /= 2.0
         vector = Actions.directionToVector(action, speed)
+        state.data._toggleAgentHash(ghostIndex)
         ghostState.configuration = ghostState.configuration.generateSuccessor(
             vector)
+        state.data._toggleAgentHash(ghostIndex)
     applyAction = staticmethod(applyAction)
 
     def decrementTimer(ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint(
-                ghostState.configuration.pos)
+            configuration = ghostState.configuration
+            ghostState.configuration = Configuration(
+                nearestPoint(configuration.pos), configuration.direction)
         ghostState.scaredTimer = max(0, timer - 1)
     decrementTimer = staticmethod(decrementTimer)
 
@@ -460,9 +575,13 @@ class GhostRules:
     def collide(state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            ghostState = state.data._privateAgentState(agentIndex)
+            state.data._toggleAgentHash(agentIndex)
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
+            state.data._toggleAgentHash(agentIndex)
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -542,10 +661,16 @@ def readCommand(argv):
                       help=default('Zoom the size of the graphics window'), default=1.0)
     parser.add_option('-f', '--fixRandomSeed', action='store_true', dest='fixRandomSeed',
                       help='Fixes the random seed to always play the same game', default=False)
+    parser.add_option('--seed', dest='seed', type='int',
+                      help='Plays every game from a seed derived from SEED and the game number, so runs repeat for any --workers',
+                      metavar='SEED', default=None)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('The number of processes the (non-training) games are shared among; needs -q'),
+                      default=1)
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file (see recording.py) to replay', default=None)
     parser.add_option('-a', '--agentArgs', dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -554,8 +679,15 @@ def readCommand(argv):
                       help=default('Time to delay between frames; <0 means keyboard'), default=0.1)
     parser.add_option('-c', '--catchExceptions', action='store_true', dest='catchExceptions',
                       help='Turns on exception handling and timeouts during games', default=False)
-    parser.add_option('--timeout', dest='timeout', type='int',
-                      help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--timeout', dest='timeout', type='float',
+                      help=default('Maximum length of time (in seconds) an agent can spend computing in a single game'), default=30)
+    parser.add_option('--moveTimeout', dest='moveTimeout', type='float',
+                      help='Maximum length of time (in seconds, e.g. 0.05) an agent can spend on a single move; defaults to the game timeout',
+                      default=None)
+    parser.add_option('--observationMode', dest='observationMode', type='choice',
+                      choices=list(OBSERVATION_MODES),
+                      help=default('How agents see the state: safe-copy gives them a copy, '
+                                   'zero-copy the live read-only state'), default=SAFE_COPY)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -617,18 +749,21 @@ def readCommand(argv):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['moveTimeout'] = options.moveTimeout
+    args['workers'] = options.workers
+    args['seed'] = options.seed
+    args['observationMode'] = options.observationMode
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print('Replaying recorded game %s.' % options.gameToReplay)
-        import pickle
-        f = open(options.gameToReplay)
+        import recording
+        recorded = recording.Recording(options.gameToReplay)
         try:
-            recorded = pickle.load(f)
+            replayGame(recorded.getLayout(), recorded.moves(), args['display'],
+                       recorded.getNumAgents() - 1)
         finally:
-            f.close()
-        recorded['display'] = args['display']
-        replayGame(**recorded)
+            recorded.close()
         sys.exit(0)
 
     return args
@@ -662,13 +797,19 @@ def loadAgent(pacman, nographics):
                     ' is not specified in any *Agents.py.')
 
 
-def replayGame(layout, actions, display):
+def replayGame(layout, actions, display, numGhosts=None):
+    """
+    Shows a recorded game.  The actions may be any iterable of
+    (agentIndex, action) pairs, such as a stream read from a recording.
+    """
     import pacmanAgents
     import ghostAgents
+    if numGhosts == None:
+        numGhosts = layout.getNumGhosts()
     rules = ClassicGameRules()
     agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1)
-                                             for i in range(layout.getNumGhosts())]
-    game = rules.newGame(layout, agents[0], agents[1:], display)
+                                             for i in range(numGhosts)]
+    game = rules.newGame(layout, -1, agents[0], agents[1:], display)
     state = game.state
     display.initialize(state.data)
 
@@ -683,40 +824,147 @@ def replayGame(layout, actions, display):
     display.finish()
 
 
-def runGames(layout, horizon, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30):
+def gameSeed(masterSeed, index):
+    """
+    The seed the game with the given index is played from.  It depends only on
+    the master seed and the index, so every game plays out the same however
+    many worker processes share the games.
+    """
+    return '%s-%d' % (masterSeed, index)
+
+
+class GamePlayer:
+    """
+    Plays the games of one runGames call by index.  Worker processes are
+    forked with the GamePlayer (and so the trained agents) already in memory,
+    so agents never need to be pickled.
+    """
+
+    def __init__(self, layout, horizon, pacman, ghosts, display, numTraining,
+                 catchExceptions, timeout, moveTimeout, observationMode, seed,
+                 record=False):
+        self.layout = layout
+        self.horizon = horizon
+        self.pacman = pacman
+        self.ghosts = ghosts
+        self.display = display
+        self.numTraining = numTraining
+        self.catchExceptions = catchExceptions
+        self.observationMode = observationMode
+        self.seed = seed
+        self.record = record
+        self.rules = ClassicGameRules(timeout, moveTimeout)
+
+    def play(self, index):
+        beQuiet = index < self.numTraining
+        if beQuiet:
+                # Suppress output and graphics
+            import textDisplay
+            gameDisplay = textDisplay.NullGraphics()
+            self.rules.quiet = True
+        else:
+            gameDisplay = self.display
+            self.rules.quiet = False
+        seed = None
+        if self.seed != None:
+            seed = gameSeed(self.seed, index)
+            random.seed(seed)
+        game = self.rules.newGame(self.layout, self.horizon, self.pacman, self.ghosts,
+                                  gameDisplay, beQuiet, self.catchExceptions,
+                                  self.observationMode)
+        if self.record:
+            import recording
+            fname = ('recorded-game-%d-' % (index + 1)) + \
+                '-'.join([str(t) for t in time.localtime()[1:6]])
+            game.recorder = recording.GameRecorder(fname, self.layout, game.agents, seed)
+        try:
+            game.run()
+        finally:
+            if game.recorder != None:
+                game.recorder.close()
+        return game
+
+
+class FinishedGame:
+    """
+    What a worker process sends back of a Game: its final state, its move
+    history and how the agents fared.
+    """
+
+    def __init__(self, game):
+        self.state = game.state
+        self.moveHistory = game.moveHistory
+        self.agentCrashed = game.agentCrashed
+        self.agentTimeout = game.agentTimeout
+        self.totalAgentTimes = game.totalAgentTimes
+
+
+# The GamePlayer of the runGames call whose worker processes are running
+_workerPlayer = None
+
+
+def _playInWorker(index):
+    return FinishedGame(_workerPlayer.play(index))
+
+
+def playInWorkers(player, indices, workers):
+    """
+    Plays the games with the given indices in a pool of forked processes and
+    returns them in index order.
+    """
+    global _workerPlayer
+    import multiprocessing
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise Exception('Running games in worker processes needs os.fork')
+    _workerPlayer = player
+    try:
+        pool = multiprocessing.get_context('fork').Pool(workers)
+        try:
+            chunksize = max(1, len(indices) // (workers * 4))
+            return pool.map(_playInWorker, indices, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _workerPlayer = None
+
+
+def runGames(layout, horizon, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30, observationMode=SAFE_COPY, moveTimeout=None, workers=1, seed=None):
+    """
+    Plays numGames games, the first numTraining of them quietly, and returns
+    the others.
+
+    With workers > 1 the training games are still played here, one after
+    another, and the remaining games are then shared among that many forked
+    processes, which return FinishedGames.  If seed is given, every game is
+    played from gameSeed(seed, index), so the results do not depend on the
+    number of workers.
+    """
     import __main__
     __main__.__dict__['_display'] = display
 
-    rules = ClassicGameRules(timeout)
+    if workers > 1:
+        if not getattr(display, 'checkNullDisplay', lambda: False)():
+            raise Exception('Games in worker processes cannot be displayed; use -q')
+        if seed == None:
+            seed = random.getrandbits(32)
+
+    player = GamePlayer(layout, horizon, pacman, ghosts, display, numTraining,
+                        catchExceptions, timeout, moveTimeout, observationMode, seed,
+                        record)
     games = []
 
     for i in range(numGames):
         # if i % 10 == 0:
         #     print("numGames played: [{}/{}]".format(i, numGames))
-        beQuiet = i < numTraining
-        if beQuiet:
-                # Suppress output and graphics
-            import textDisplay
-            gameDisplay = textDisplay.NullGraphics()
-            rules.quiet = True
-        else:
-            gameDisplay = display
-            rules.quiet = False
-        game = rules.newGame(layout, horizon, pacman, ghosts,
-                             gameDisplay, beQuiet, catchExceptions)
-        game.run()
-        if not beQuiet:
+        if workers > 1 and i >= numTraining:
+            break
+        game = player.play(i)
+        if i >= numTraining:
             games.append(game)
 
-        if record:
-            import time
-            import pickle
-            fname = ('recorded-game-%d' % (i + 1)) + \
-                '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            pickle.dump(components, f)
-            f.close()
+    if workers > 1 and numGames > numTraining:
+        games = playInWorkers(player, range(numTraining, numGames), workers)
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
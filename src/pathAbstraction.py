@@ -0,0 +1,244 @@
+# pathAbstraction.py
+# ------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Hierarchical path planning (HPA*) for layouts too large to search cell by
+cell.
+
+The layout is cut into square clusters of CLUSTER_SIZE cells.  Where two
+clusters share a stretch of open border, an entrance lets paths cross: one
+pair of facing cells in the middle of a narrow stretch, one at each end of
+a wide one.  Those cells are the nodes of an abstract graph, joined across
+borders by single moves and, inside a cluster, by the lengths of the
+shortest paths between its entrance cells that stay in the cluster.
+
+A query searches the abstract graph from the start to the goal, then
+refines every abstract edge into moves.  The plans found are close to
+shortest, but not always shortest.
+
+The abstraction of a layout is built once per process and shared (see
+getAbstraction); the paths inside a cluster are only searched the first
+time a query passes through it.  It reads the layout's walls directly, so
+nothing is built per cell of the whole map.
+
+  abstraction = getAbstraction(gameState.data.layout)
+  abstraction.findPath((1, 1), (480, 311))
+"""
+
+import util
+from game import Actions
+from game import Directions
+
+CLUSTER_SIZE = 16
+# Stretches of open border up to this long get one entrance, longer ones two
+MAX_SINGLE_ENTRANCE = 6
+_MOVES = [(direction, Actions._directions[direction]) for direction in
+          [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]]
+
+_ABSTRACTIONS = {}
+
+
+def getAbstraction(layout, clusterSize=CLUSTER_SIZE):
+    """
+    Returns the PathAbstraction of a layout, shared by every caller in the
+    process.
+    """
+    key = (layout.contentHash, clusterSize)
+    abstraction = _ABSTRACTIONS.get(key)
+    if abstraction == None:
+        abstraction = _ABSTRACTIONS[key] = PathAbstraction(layout, clusterSize)
+    return abstraction
+
+
+class PathAbstraction:
+    """
+    The clusters and entrances of one layout, over the (x,y) positions of its
+    open cells.
+
+      entrances[c]          the entrance cells of cluster c
+      crossings[cell]       (cell, direction) moves from an entrance cell into
+                            the neighbouring clusters
+      intraEdges[c]         None until cluster c is first searched, then
+                            entrance -> [(other entrance, distance)]
+    """
+
+    def __init__(self, layout, clusterSize=CLUSTER_SIZE):
+        self.layout = layout
+        self.walls = layout.walls
+        self.clusterSize = clusterSize
+        self.clustersHigh = (layout.height + clusterSize - 1) // clusterSize
+        numClusters = ((layout.width + clusterSize - 1) // clusterSize) * self.clustersHigh
+        self.entrances = [[] for cluster in range(numClusters)]
+        self.crossings = {}
+        self.intraEdges = [None] * numClusters
+        self.expanded = 0
+        self._findEntrances()
+
+    def clusterOf(self, cell):
+        x, y = cell
+        return (x // self.clusterSize) * self.clustersHigh + y // self.clusterSize
+
+    def _isOpen(self, x, y):
+        walls = self.walls
+        return 0 <= x < walls.width and 0 <= y < walls.height and not walls[x][y]
+
+    def _findEntrances(self):
+        walls, size = self.layout.walls, self.clusterSize
+        # Borders between columns of clusters, then between rows
+        for x in range(size - 1, walls.width - 1, size):
+            for start in range(0, walls.height, size):
+                cells = [((x, y), (x + 1, y)) for y in range(start, min(start + size, walls.height))]
+                self._addEntrances(cells, Directions.EAST)
+        for y in range(size - 1, walls.height - 1, size):
+            for start in range(0, walls.width, size):
+                cells = [((x, y), (x, y + 1)) for x in range(start, min(start + size, walls.width))]
+                self._addEntrances(cells, Directions.NORTH)
+
+    def _addEntrances(self, cells, direction):
+        """
+        Adds the entrances along one border: cells lists the facing pairs of
+        cells, and direction leads from the first of a pair to the second.
+        """
+        walls = self.layout.walls
+        stretch = []
+        for inside, outside in cells + [(None, None)]:
+            if inside != None and not walls[inside[0]][inside[1]] and \
+                    not walls[outside[0]][outside[1]]:
+                stretch.append((inside, outside))
+                continue
+            if len(stretch) == 0:
+                continue
+            if len(stretch) <= MAX_SINGLE_ENTRANCE:
+                chosen = [stretch[len(stretch) // 2]]
+            else:
+                chosen = [stretch[0], stretch[-1]]
+            for inside, outside in chosen:
+                self._addCrossing(inside, outside, direction)
+                self._addCrossing(outside, inside, Actions.reverseDirection(direction))
+            stretch = []
+
+    def _addCrossing(self, cell, neighbor, direction):
+        if cell not in self.crossings:
+            self.crossings[cell] = []
+            self.entrances[self.clusterOf(cell)].append(cell)
+        self.crossings[cell].append((neighbor, direction))
+
+    def searchCluster(self, source):
+        """
+        Breadth first search from the cell source, staying inside its
+        cluster.  Returns the distances and the parents (cell -> (previous
+        cell, direction)) of the cells reached.
+        """
+        size, walls = self.clusterSize, self.walls.data
+        left, bottom = source[0] - source[0] % size, source[1] - source[1] % size
+        right, top = min(left + size, self.walls.width), min(bottom + size, self.walls.height)
+        distances = {source: 0}
+        parents = {source: None}
+        frontier = [source]
+        distance = 0
+        while frontier:
+            distance += 1
+            nextFrontier = []
+            for cell in frontier:
+                x, y = cell
+                for direction, (dx, dy) in _MOVES:
+                    nextx, nexty = x + dx, y + dy
+                    if left <= nextx < right and bottom <= nexty < top and not walls[nextx][nexty]:
+                        neighbor = (nextx, nexty)
+                        if neighbor not in distances:
+                            distances[neighbor] = distance
+                            parents[neighbor] = (cell, direction)
+                            nextFrontier.append(neighbor)
+            frontier = nextFrontier
+        return distances, parents
+
+    def getIntraEdges(self, cluster):
+        "The paths between the entrances of a cluster, searched on first use"
+        if self.intraEdges[cluster] == None:
+            edges = {}
+            for entrance in self.entrances[cluster]:
+                distances = self.searchCluster(entrance)[0]
+                edges[entrance] = [(other, distances[other])
+                                   for other in self.entrances[cluster]
+                                   if other != entrance and other in distances]
+            self.intraEdges[cluster] = edges
+        return self.intraEdges[cluster]
+
+    def findPath(self, start, goal):
+        """
+        Returns the Directions of a path from position start to position
+        goal, or None if there is none.  self.expanded counts the abstract
+        nodes the query expanded.
+        """
+        start, goal = (int(start[0]), int(start[1])), (int(goal[0]), int(goal[1]))
+        if not self._isOpen(*start) or not self._isOpen(*goal):
+            raise Exception('No path can start or end in a wall: %s, %s' % (start, goal))
+        self.expanded = 0
+        if start == goal:
+            return []
+        startDistances = self.searchCluster(start)[0]
+        goalDistances = self.searchCluster(goal)[0]
+        goalCluster = self.clusterOf(goal)
+
+        # A* over the abstract graph; parents: cell -> (previous cell, direction
+        # of a crossing, or None for a path inside a cluster)
+        frontier = util.BucketQueue()
+        costs = {start: 0}
+        parents = {start: None}
+        frontier.push(start, util.manhattanDistance(start, goal))
+        while not frontier.isEmpty():
+            node = frontier.pop()
+            if node == goal:
+                return self._refine(parents, goal)
+            self.expanded += 1
+
+            if node == start:
+                edges = [(other, distance, None) for other, distance in startDistances.items()
+                         if other != start and (other in self.crossings or other == goal)]
+            else:
+                cluster = self.clusterOf(node)
+                edges = [(other, distance, None) for other, distance in
+                         self.getIntraEdges(cluster)[node]]
+                if cluster == goalCluster and node in goalDistances:
+                    edges.append((goal, goalDistances[node], None))
+            for neighbor, direction in self.crossings.get(node, []):
+                edges.append((neighbor, 1, direction))
+
+            for neighbor, distance, direction in edges:
+                cost = costs[node] + distance
+                if neighbor in costs and costs[neighbor] <= cost:
+                    continue
+                costs[neighbor] = cost
+                parents[neighbor] = (node, direction)
+                frontier.update(neighbor, cost + util.manhattanDistance(neighbor, goal))
+        return None
+
+    def _refine(self, parents, goal):
+        "The Directions along the abstract path to goal"
+        actions = []
+        node = goal
+        while parents[node] != None:
+            previous, direction = parents[node]
+            if direction != None:
+                actions.append(direction)
+            else:
+                # A path inside a cluster: search it again, from its start
+                clusterParents = self.searchCluster(previous)[1]
+                step = node
+                while step != previous:
+                    step, move = clusterParents[step]
+                    actions.append(move)
+            node = previous
+        actions.reverse()
+        return actions
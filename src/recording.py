@@ -0,0 +1,315 @@
+# recording.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Compact game recordings, written while the game is played.
+
+A recording file starts with a header:
+
+  MAGIC, one VERSION byte, a 4 byte little-endian length and that many bytes
+  of UTF-8 JSON naming the layout (name and content hash), the seed and the
+  agents.
+
+It is followed by a stream of records.  A byte below 0x80 is a move: the
+agent index in bits 3-6 and the action code (an index into ACTIONS) in bits
+0-2.  A byte of 0x80 or more is a tag, followed by a 4 byte little-endian
+length and that many bytes of payload; readers skip tags they do not know.
+
+Moves are flushed every FLUSH_INTERVAL moves, so the recording of a game
+whose process died is still readable up to its last flush.
+
+Every SNAPSHOT_INTERVAL moves the recorder also writes a SNAPSHOT_TAG record
+holding the move number and the state after that move (GameState.toBytes),
+which lets a Replay jump into the middle of a long game without re-simulating
+all of it.
+"""
+
+import json
+import struct
+
+from game import Directions
+import layout
+
+MAGIC = b'PACREC'
+VERSION = 1
+ACTIONS = (Directions.NORTH, Directions.SOUTH, Directions.EAST,
+           Directions.WEST, Directions.STOP)
+ACTION_CODES = dict([(action, code) for code, action in enumerate(ACTIONS)])
+MAX_AGENTS = 16
+TAGGED_RECORD = 0x80
+SNAPSHOT_TAG = 0x81
+FLUSH_INTERVAL = 32
+SNAPSHOT_INTERVAL = 500
+
+_LENGTH = struct.Struct('<I')
+_MOVE_NUMBER = struct.Struct('<I')
+
+
+def encodeMove(agentIndex, action):
+    if not 0 <= agentIndex < MAX_AGENTS:
+        raise Exception('Recordings hold at most %d agents' % MAX_AGENTS)
+    return (agentIndex << 3) | ACTION_CODES[action]
+
+
+def decodeMove(byte):
+    return byte >> 3, ACTIONS[byte & 7]
+
+
+def encodeState(state):
+    """
+    Serializes a state for a snapshot record (see GameState.toBytes); the
+    recording names the layout in its header.
+    """
+    return state.toBytes()
+
+
+def decodeState(payload, gameLayout):
+    from pacman import GameState
+    return GameState.fromBytes(payload, gameLayout)
+
+
+class GameRecorder:
+    """
+    Writes the recording of one game to a file as the game is played.  The
+    Game calls recordMove with the new state after every move; close the
+    recorder once the game is over.
+    """
+
+    def __init__(self, fileName, gameLayout, agents, seed=None,
+                 snapshotInterval=SNAPSHOT_INTERVAL):
+        header = {'layout': gameLayout.name,
+                  'layoutHash': gameLayout.contentHash,
+                  'seed': seed,
+                  'agents': [type(agent).__name__ for agent in agents],
+                  'snapshotInterval': snapshotInterval}
+        header = json.dumps(header).encode('utf-8')
+        self.file = open(fileName, 'wb')
+        self.file.write(MAGIC + bytes([VERSION]) + _LENGTH.pack(len(header)) + header)
+        self.file.flush()
+        self.snapshotInterval = snapshotInterval
+        self.numMoves = 0
+        self.unflushed = 0
+
+    def recordMove(self, agentIndex, action, state=None):
+        self.file.write(bytes([encodeMove(agentIndex, action)]))
+        self.numMoves += 1
+        if state != None and self.snapshotInterval and \
+                self.numMoves % self.snapshotInterval == 0:
+            self.writeRecord(SNAPSHOT_TAG, _MOVE_NUMBER.pack(self.numMoves) +
+                             encodeState(state))
+        self.unflushed += 1
+        if self.unflushed >= FLUSH_INTERVAL:
+            self.file.flush()
+            self.unflushed = 0
+
+    def writeRecord(self, tag, payload):
+        """
+        Appends a tagged record; tag must be between 0x80 and 0xff.
+        """
+        if not TAGGED_RECORD <= tag <= 0xff:
+            raise Exception('Bad record tag: %d' % tag)
+        self.file.write(bytes([tag]) + _LENGTH.pack(len(payload)) + payload)
+
+    def close(self):
+        self.file.close()
+
+
+class Recording:
+    """
+    A recording file opened for reading: the header is read at once, the
+    moves are streamed by moves().
+    """
+
+    def __init__(self, fileName):
+        self.file = open(fileName, 'rb')
+        start = self.file.read(len(MAGIC) + 1 + _LENGTH.size)
+        if len(start) < len(MAGIC) + 1 + _LENGTH.size or not start.startswith(MAGIC):
+            self.file.close()
+            raise Exception('%s is not a game recording' % fileName)
+        if start[len(MAGIC)] != VERSION:
+            self.file.close()
+            raise Exception('%s has unknown recording version %d' %
+                            (fileName, start[len(MAGIC)]))
+        headerLength = _LENGTH.unpack_from(start, len(MAGIC) + 1)[0]
+        self.header = json.loads(self.file.read(headerLength).decode('utf-8'))
+
+    def getNumAgents(self):
+        return len(self.header['agents'])
+
+    def getLayout(self):
+        """
+        Loads the recorded layout by name and checks that it is the board the
+        game was played on.
+        """
+        name = self.header['layout']
+        gameLayout = name != None and layout.getLayout(name)
+        if not gameLayout:
+            raise Exception('The recorded layout %s cannot be found' % name)
+        if gameLayout.contentHash != self.header['layoutHash']:
+            raise Exception('The layout %s has changed since the game was recorded' % name)
+        return gameLayout
+
+    def records(self):
+        """
+        Yields (tag, payload) for every record, with tag None and payload
+        (agentIndex, action) for moves.  A record cut short by the end of the
+        file ends the stream.
+        """
+        read = self.file.read
+        while True:
+            chunk = read(4096)
+            if not chunk:
+                return
+            position = 0
+            while position < len(chunk):
+                byte = chunk[position]
+                position += 1
+                if byte < TAGGED_RECORD:
+                    yield None, decodeMove(byte)
+                    continue
+                rest = chunk[position:]
+                if len(rest) < _LENGTH.size:
+                    rest += read(_LENGTH.size - len(rest))
+                if len(rest) < _LENGTH.size:
+                    return
+                length = _LENGTH.unpack_from(rest)[0]
+                payload = rest[_LENGTH.size:_LENGTH.size + length]
+                if len(payload) < length:
+                    payload += read(length - len(payload))
+                if len(payload) < length:
+                    return
+                yield byte, payload
+                position += _LENGTH.size + length
+                if position > len(chunk):
+                    # The record ran past the chunk; carry on after it
+                    chunk = b''
+
+    def moves(self):
+        """
+        Yields the recorded (agentIndex, action) moves in order.
+        """
+        for tag, payload in self.records():
+            if tag == None:
+                yield payload
+
+    def close(self):
+        self.file.close()
+
+
+class Replay:
+    """
+    Random access to a recorded game.  The moves are kept in memory, one
+    byte each, along with the recorded snapshots; a state is rebuilt from the
+    nearest snapshot at or before it by replaying the moves after it.  The
+    states of the last stretch replayed are kept, so stepping back and
+    forth near the current move is cheap.
+
+    The position is a move number: 0 is the initial state and len(replay)
+    the state after the last recorded move.
+    """
+
+    def __init__(self, fileName):
+        recording = Recording(fileName)
+        try:
+            self.header = recording.header
+            self.layout = recording.getLayout()
+            moves = bytearray()
+            self.snapshots = {}
+            for tag, payload in recording.records():
+                if tag == None:
+                    moves.append(encodeMove(*payload))
+                elif tag == SNAPSHOT_TAG:
+                    moveNumber = _MOVE_NUMBER.unpack_from(payload)[0]
+                    self.snapshots[moveNumber] = payload[_MOVE_NUMBER.size:]
+        finally:
+            recording.close()
+        self.moves = bytes(moves)
+        self.snapshotMoves = sorted(self.snapshots)
+        self.segmentStart = 0
+        self.segment = [self.getInitialState()]
+        self.position = 0
+
+    def __len__(self):
+        return len(self.moves)
+
+    def getInitialState(self):
+        from pacman import GameState
+        state = GameState()
+        state.initialize(self.layout, len(self.header['agents']) - 1)
+        return state
+
+    def getMove(self, moveNumber):
+        """
+        The (agentIndex, action) of the move that leads to state moveNumber.
+        """
+        return decodeMove(self.moves[moveNumber - 1])
+
+    def getMoves(self, start, stop):
+        return [decodeMove(byte) for byte in self.moves[start:stop]]
+
+    def getState(self):
+        return self.segment[self.position - self.segmentStart]
+
+    def seek(self, moveNumber):
+        """
+        Moves to the state after moveNumber moves and returns it.
+        """
+        if not 0 <= moveNumber <= len(self.moves):
+            raise IndexError('move %d is outside the recording (0-%d)' %
+                             (moveNumber, len(self.moves)))
+        end = self.segmentStart + len(self.segment) - 1
+        if not self.segmentStart <= moveNumber <= end:
+            start = self._nearestSnapshot(moveNumber)
+            if self.segmentStart <= moveNumber and self.segmentStart >= start:
+                # Carry on from the stretch already replayed
+                start = self.segmentStart
+            else:
+                if start == 0:
+                    state = self.getInitialState()
+                else:
+                    state = decodeState(self.snapshots[start], self.layout)
+                self.segmentStart = start
+                self.segment = [state]
+            self._replayTo(moveNumber)
+        self.position = moveNumber
+        return self.getState()
+
+    def stepForward(self):
+        return self.seek(self.position + 1)
+
+    def stepBack(self):
+        return self.seek(self.position - 1)
+
+    def extract(self, start, stop):
+        """
+        Returns the states after start, start + 1, ..., stop - 1 moves.
+        """
+        stop = min(stop, len(self.moves) + 1)
+        states = []
+        for moveNumber in range(start, stop):
+            states.append(self.seek(moveNumber))
+        return states
+
+    def _nearestSnapshot(self, moveNumber):
+        import bisect
+        index = bisect.bisect_right(self.snapshotMoves, moveNumber)
+        if index == 0:
+            return 0
+        return self.snapshotMoves[index - 1]
+
+    def _replayTo(self, moveNumber):
+        state = self.segment[-1]
+        for byte in self.moves[self.segmentStart + len(self.segment) - 1:moveNumber]:
+            state = state.generateSuccessor(*decodeMove(byte))
+            self.segment.append(state)
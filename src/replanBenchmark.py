@@ -0,0 +1,118 @@
+# replanBenchmark.py
+# ------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Measures what replanning before every move costs GhostAvoidingSearchAgent,
+which repairs one D* Lite plan as the ghosts move, against searching again
+with A* (Manhattan heuristic) on the same costs:
+
+  python replanBenchmark.py
+  python replanBenchmark.py -l originalClassic -k 2 -n 10
+
+Pacman heads for the corner furthest from its start while the ghosts move by
+the game's rules; a game ends when Pacman gets there, wins or loses, or after
+the move limit.  Both planners must find plans of the same cost.
+"""
+
+from optparse import OptionParser
+import random
+import sys
+import time
+
+import layout
+import pacman
+import search
+import searchAgents
+
+
+def runBenchmark(layoutName, ghostType, numGhosts, numGames, seed, maxMoves):
+    """
+    Returns (plans, nodes expanded and seconds for the incremental plans,
+    nodes expanded and seconds for the fresh ones, plans whose costs differ).
+    """
+    random.seed(seed)
+    gameLayout = layout.getLayout(layoutName)
+    plans = incrementalNodes = freshNodes = mismatches = 0
+    incrementalSeconds = freshSeconds = 0.0
+    for game in range(numGames):
+        state = pacman.GameState()
+        state.initialize(gameLayout, numGhosts)
+        ghosts = [ghostType(i + 1) for i in range(state.getNumAgents() - 1)]
+        agent = searchAgents.GhostAvoidingSearchAgent()
+        agent.registerInitialState(state)
+        for move in range(maxMoves):
+            if state.isWin() or state.isLose() or state.getPacmanPosition() == agent.goal:
+                break
+            expanded = agent.planner.expanded
+            start = time.perf_counter()
+            action = agent.getAction(state)
+            incrementalSeconds += time.perf_counter() - start
+            incrementalNodes += agent.planner.expanded - expanded
+
+            # The fresh plan pays for working the costs out too
+            start = time.perf_counter()
+            costs = agent.getDangerCosts(state)
+            problem = searchAgents.PositionSearchProblem(
+                state, costFn=lambda position: costs.get(position, 1), goal=agent.goal,
+                warn=False, visualize=False)
+            actions = search.astar(problem, searchAgents.manhattanHeuristic)
+            freshSeconds += time.perf_counter() - start
+            freshNodes += problem._expanded
+            plans += 1
+            if problem.getCostOfActions(actions) != problem.getCostOfActions(agent.planner.getPath()):
+                mismatches += 1
+
+            state = state.generateSuccessor(0, action)
+            for ghost in ghosts:
+                if state.isWin() or state.isLose():
+                    break
+                state = state.generateSuccessor(ghost.index, ghost.getAction(state))
+    return plans, incrementalNodes, incrementalSeconds, freshNodes, freshSeconds, mismatches
+
+
+def readCommand(argv):
+    parser = OptionParser(__doc__)
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic',
+                      help=pacman.default('the LAYOUT_FILE to play on'), metavar='LAYOUT_FILE')
+    parser.add_option('-g', '--ghosts', dest='ghost', default='RandomGhost',
+                      help=pacman.default('the ghost agent TYPE'), metavar='TYPE')
+    parser.add_option('-k', '--numghosts', type='int', dest='numGhosts', default=4,
+                      help=pacman.default('the maximum number of ghosts to use'))
+    parser.add_option('-n', '--numGames', type='int', dest='numGames', default=20,
+                      help=pacman.default('the number of GAMES to play'), metavar='GAMES')
+    parser.add_option('-m', '--maxMoves', type='int', dest='maxMoves', default=500,
+                      help=pacman.default('the most moves Pacman makes in a game'))
+    parser.add_option('--seed', type='int', dest='seed', default=188,
+                      help=pacman.default('the random seed the games start from'))
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    ghostType = pacman.loadAgent(options.ghost, True)
+    plans, incrementalNodes, incrementalSeconds, freshNodes, freshSeconds, mismatches = \
+        runBenchmark(options.layout, ghostType, options.numGhosts, options.numGames,
+                     options.seed, options.maxMoves)
+
+    print('%s, %s, %d games, %d plans' % (options.layout, options.ghost, options.numGames, plans))
+    print('%-12s %9d nodes expanded %8.2fs' % ('D* Lite', incrementalNodes, incrementalSeconds))
+    print('%-12s %9d nodes expanded %8.2fs' % ('fresh A*', freshNodes, freshSeconds))
+    if incrementalNodes > 0 and incrementalSeconds > 0:
+        print('fresh / D* Lite: x%.2f the nodes, x%.2f the time' %
+              (freshNodes / incrementalNodes, freshSeconds / incrementalSeconds))
+    if mismatches:
+        print('%d plans differ in cost' % mismatches)
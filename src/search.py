@@ -9,6 +9,7 @@ Pacman agents (in searchAgents.py).
 
 import util
 from game import Directions
+from game import Actions
 from typing import List
 
 class SearchProblem:
@@ -53,6 +54,49 @@ class SearchProblem:
         """
         util.raiseNotDefined()
 
+    def getPredecessors(self, state):
+        """
+          state: Search state
+
+        Only needed by the bidirectional searches, which also expect a single
+        goal state, self.goal.  For a given state, this should return a list
+        of triples, (predecessor, action, stepCost), where 'action' leads from
+        'predecessor' to state at a cost of 'stepCost'.
+        """
+        util.raiseNotDefined()
+
+
+class ReverseSearchProblem(SearchProblem):
+    """
+    A search problem backwards, from its goal (problem.goal) to its start
+    state, through problem.getPredecessors.  The actions are still those of
+    the original problem, so a plan for this problem is a plan for the
+    original one read backwards.
+
+    Any other attribute is the original problem's, except that self.goal is
+    its start state: a heuristic written for problem.goal estimates the
+    cost back to the start.
+    """
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.goal = problem.getStartState()
+
+    def getStartState(self):
+        return self.problem.goal
+
+    def isGoalState(self, state):
+        return state == self.goal
+
+    def getSuccessors(self, state):
+        return self.problem.getPredecessors(state)
+
+    def getCostOfActions(self, actions):
+        return self.problem.getCostOfActions(list(reversed(actions)))
+
+    def __getattr__(self, name):
+        return getattr(self.problem, name)
+
 
 
 
@@ -65,6 +109,19 @@ def tinyMazeSearch(problem: SearchProblem) -> List[Directions]:
     w = Directions.WEST
     return  [s, s, w, s, w, w, s, w]
 
+def reconstructActions(parents, node):
+    """
+    Returns the actions of the path from the start to node, following parent
+    pointers: parents[node] is (parent node, action), or None for the start.
+    parents may be a dict keyed by state or a list indexed by node number.
+    """
+    actions = []
+    while parents[node] != None:
+        node, action = parents[node]
+        actions.append(action)
+    actions.reverse()
+    return actions
+
 def depthFirstSearch(problem: SearchProblem) -> List[Directions]:
     """
     Search the deepest nodes in the search tree first.
@@ -82,49 +139,51 @@ def depthFirstSearch(problem: SearchProblem) -> List[Directions]:
     "*** YOUR CODE HERE ***"
     frontier = util.Stack()
     explored = set()
+    parents = dict() # state -> (parent, action) of the path to it pushed last, which is popped first
     startState = problem.getStartState()
-    startNode = (startState, [], 0)
-    frontier.push(startNode)
+    parents[startState] = None
+    frontier.push(startState)
     while not frontier.isEmpty():
-        currentState, actions, currentCost = frontier.pop()
+        currentState = frontier.pop()
         if problem.isGoalState(currentState):
-            return actions
+            return reconstructActions(parents, currentState)
 
         # Explore
 
         if currentState not in explored:
             explored.add(currentState)
-            for (newState, newAction, preCost) in problem.getSuccessors(currentState):
-                child_node = (newState, actions + [newAction], preCost + 1)
-                frontier.push(child_node)
+            for (newState, newAction, stepCost) in problem.getSuccessors(currentState):
+                # The path to an explored state is final, and pushing it again would only be skipped
+                if newState not in explored:
+                    parents[newState] = (currentState, newAction)
+                    frontier.push(newState)
     return []
 
 def breadthFirstSearch(problem: SearchProblem) -> List[Directions]:
     """Search the shallowest nodes in the search tree first."""
     "*** YOUR CODE HERE ***"
     frontier = util.Queue()
-    explored = set()
+    parents = dict() # state -> (parent, action) of the first (shallowest) path found to it
     startState = problem.getStartState()
-    startNode = (startState, [], 0)
-    frontier.push(startNode)
+    parents[startState] = None
+    frontier.push(startState)
     while not frontier.isEmpty():
-        currentState, actions, currentCost = frontier.pop()
+        currentState = frontier.pop()
         if problem.isGoalState(currentState):
-            return actions
+            return reconstructActions(parents, currentState)
 
-        # Explore
+        # Explore: each state is queued once, when it is first reached
 
-        if currentState not in explored:
-            explored.add(currentState)
-            for (newState, newAction, preCost) in problem.getSuccessors(currentState):
-                child_node = (newState, actions + [newAction], preCost + 1)
-                frontier.push(child_node)
+        for (newState, newAction, stepCost) in problem.getSuccessors(currentState):
+            if newState not in parents:
+                parents[newState] = (currentState, newAction)
+                frontier.push(newState)
     return []
 
 def uniformCostSearch(problem: SearchProblem) -> List[Directions]:
     """Search the node of least total cost first."""
     "*** YOUR CODE HERE ***"
-    util.raiseNotDefined()
+    return aStarSearch(problem, nullHeuristic)
 
 def nullHeuristic(state, problem=None) -> float:
     """
@@ -134,43 +193,268 @@ def nullHeuristic(state, problem=None) -> float:
     return 0
 
 def aStarSearch(problem: SearchProblem, heuristic=nullHeuristic) -> List[Directions]:
-    # Create frontier
-    frontier = util.PriorityQueue()
-    explored_to_min_cost = dict() # this dict will store the minimum cost reached of each state that has been explored
-    # Storage explored node to keep track minium value
+    # Create frontier of states: a state is queued at most once, and finding a
+    # cheaper path to a queued state lowers its priority in place.  While the
+    # priorities are small integers it is a bucket queue, which breaks ties in
+    # favor of the node found last; otherwise it turns into a binary heap
+    frontier = util.BucketQueue()
+    min_cost = dict() # this dict will store the minimum cost reached of each state found so far
+    min_cost_node = dict() # and the node of that cheapest path in the search tree
+    # Search tree: node -> (parent node, action).  Nodes are numbered paths rather
+    # than states, as a state can be reopened after its successors were reached
+    tree = [None]
     start_state = problem.getStartState()
-    start_actions = []
     start_cost = 0
 
-    # Add stater node to frontier
-    start_node = (start_state, start_actions, start_cost)
-    frontier.push(start_node, start_cost)
+    # Add starter node to frontier
+    min_cost[start_state] = start_cost
+    min_cost_node[start_state] = 0
+    frontier.push(start_state, start_cost)
 
     # Graph search until open list is empty
     while not frontier.isEmpty():
-        cur_state, cur_actions, cur_cost = frontier.pop()
+        cur_state = frontier.pop()
+        cur_node = min_cost_node[cur_state]
+        cur_cost = min_cost[cur_state]
 
         # Check if current node is goal => return actions
         if problem.isGoalState(cur_state):
-            return cur_actions
-        
+            return reconstructActions(tree, cur_node)
 
-        # Check if node is not explore or better cost
-        if cur_state not in explored_to_min_cost or explored_to_min_cost[cur_state] > cur_cost:
-            # Mark node as explored and update the better cost (if already exist)
-            explored_to_min_cost[cur_state] = cur_cost
-            # Expand node nearby
-            for succ_state, action , succ_cost in problem.getSuccessors(cur_state):
+        # Expand node nearby
+        for succ_state, action , succ_cost in problem.getSuccessors(cur_state):
+            g_cost = cur_cost + succ_cost
 
-                succ_actions = cur_actions + [action]
-                g_cost = cur_cost + succ_cost
-                h_cost = g_cost + heuristic(succ_state, problem)
+            # Skip the successor unless this is the cheapest path to it so far
+            if succ_state in min_cost and min_cost[succ_state] <= g_cost:
+                continue
+            min_cost[succ_state] = g_cost
+            min_cost_node[succ_state] = len(tree)
+            tree.append((cur_node, action))
 
-                # NOTE: node information should contain about g_cost to track current cost without heuristic
-                succ_node = (succ_state, succ_actions, g_cost)
-                # Use h_cost for heapq priority
-                frontier.push(succ_node, h_cost)
+            # Use g_cost + h_cost for the priority; a state popped before is queued again
+            frontier.update(succ_state, g_cost + heuristic(succ_state, problem))
+
+    return []
+
+def bidirectionalBreadthFirstSearch(problem: SearchProblem) -> List[Directions]:
+    """
+    Search breadth first from the start and back from the goal at once, a
+    whole layer at a time on the side with the smaller layer, until the two
+    searches meet.  Needs problem.goal and problem.getPredecessors.
+
+    Every state reached on the other side is in a layer no deeper than its
+    last one, so the first meeting found ends a shortest path.
+    """
+    start_state = problem.getStartState()
+    goal_state = problem.goal
+    if problem.isGoalState(start_state):
+        return []
+    reverse = ReverseSearchProblem(problem)
+    forward_parents = {start_state: None} # state -> (parent, action)
+    backward_parents = {goal_state: None} # state -> (next state, action) towards the goal
+    forward_layer, backward_layer = [start_state], [goal_state]
+
+    while forward_layer and backward_layer:
+        if len(forward_layer) <= len(backward_layer):
+            layer, parents, other_parents, expand = forward_layer, forward_parents, backward_parents, problem.getSuccessors
+        else:
+            layer, parents, other_parents, expand = backward_layer, backward_parents, forward_parents, reverse.getSuccessors
+        next_layer = []
+        for state in layer:
+            for succ_state, action, step_cost in expand(state):
+                if succ_state in parents:
+                    continue
+                parents[succ_state] = (state, action)
+                if succ_state in other_parents:
+                    problem.isGoalState(goal_state) # For display purposes
+                    return joinPaths(forward_parents, backward_parents, succ_state)
+                next_layer.append(succ_state)
+        if parents is forward_parents:
+            forward_layer = next_layer
+        else:
+            backward_layer = next_layer
+    return []
+
+def bidirectionalAStarSearch(problem: SearchProblem, heuristic=nullHeuristic) -> List[Directions]:
+    """
+    A* from the start and, on the ReverseSearchProblem, back from the goal,
+    taking turns.  Needs problem.goal and problem.getPredecessors.
+
+    The two searches share the average of the heuristic towards the goal,
+    h(s) = heuristic(s, problem), and back towards the start, r(s) =
+    heuristic(s, reverse problem): going forward a state is ordered by
+    2 g(s) + h(s) - r(s), going back by 2 g(s) + r(s) - h(s), doubled to
+    stay integral.  With a consistent heuristic neither key ever decreases
+    along a path, and a path through unexpanded states of both frontiers
+    costs at least half the sum of their keys (the h and r terms cancel).
+    So once that bound reaches the cheapest path found where the searches
+    met, no path left unfound can be cheaper.
+    """
+    start_state = problem.getStartState()
+    goal_state = problem.goal
+    if problem.isGoalState(start_state):
+        return []
+    reverse = ReverseSearchProblem(problem)
+
+    def key(state, g_cost, forward):
+        towards_goal = heuristic(state, problem)
+        towards_start = heuristic(state, reverse)
+        if forward:
+            return 2 * g_cost + towards_goal - towards_start
+        return 2 * g_cost + towards_start - towards_goal
+
+    sides = []
+    for side_problem, forward in ((problem, True), (reverse, False)):
+        side_start = side_problem.getStartState()
+        frontier = util.BucketQueue()
+        frontier.push(side_start, key(side_start, 0, forward))
+        # (problem, forward?, frontier, state -> min cost, state -> (parent, action), state -> key)
+        sides.append((side_problem, forward, frontier, {side_start: 0}, {side_start: None},
+                      {side_start: key(side_start, 0, forward)}))
+    last_keys = [sides[0][5][start_state], sides[1][5][goal_state]]
+
+    best_cost, meeting_state = None, None
+    turn = 0
+    while not sides[0][2].isEmpty() and not sides[1][2].isEmpty():
+        side_problem, forward, frontier, min_cost, parents, keys = sides[turn]
+        other_min_cost = sides[1 - turn][3]
+        cur_state = frontier.pop()
+        # The other side's last key is no more than the key of its best state
+        last_keys[turn] = keys[cur_state]
+        if best_cost != None and last_keys[0] + last_keys[1] >= 2 * best_cost:
+            break
+        turn = 1 - turn
+        cur_cost = min_cost[cur_state]
+        for succ_state, action, succ_cost in side_problem.getSuccessors(cur_state):
+            g_cost = cur_cost + succ_cost
+            if succ_state in min_cost and min_cost[succ_state] <= g_cost:
+                continue
+            min_cost[succ_state] = g_cost
+            parents[succ_state] = (cur_state, action)
+            keys[succ_state] = key(succ_state, g_cost, forward)
+            frontier.update(succ_state, keys[succ_state])
+            if succ_state in other_min_cost:
+                path_cost = g_cost + other_min_cost[succ_state]
+                if best_cost == None or path_cost < best_cost:
+                    best_cost, meeting_state = path_cost, succ_state
+
+    if meeting_state == None:
+        return []
+    problem.isGoalState(goal_state) # For display purposes
+    return joinPaths(sides[0][4], sides[1][4], meeting_state)
+
+def joinPaths(forward_parents, backward_parents, meeting_state):
+    """
+    The actions from the start to meeting_state, following forward_parents,
+    and on to the goal, following backward_parents.
+    """
+    return reconstructActions(forward_parents, meeting_state) + \
+        list(reversed(reconstructActions(backward_parents, meeting_state)))
+
+def jumpPointSearch(problem: SearchProblem) -> List[Directions]:
+    """
+    Jump point search for a 4-connected grid where every move costs 1, such
+    as a PositionSearchProblem with the default cost function.  Needs
+    problem.walls and problem.goal.
+
+    Jumps take every step to cost 1, so if problem.costFn gives any open
+    cell another cost, this falls back to aStarSearch: with the Manhattan
+    distance when no cell costs less than 1, and without a heuristic
+    otherwise.
+
+    This is A* with the Manhattan distance, but a search node moves in a
+    straight line until a wall, the goal or a 'jump point': a cell beside
+    which the wall behind it opens up, or, moving vertically, a cell from
+    which a horizontal jump finds one.  Every shortest path can be bent at
+    jump points only, so only they are queued and expanded.
+
+    problem._expanded counts the jump points expanded, and problem._pruned
+    the steps of the jumps between them, which are never queued.
+    """
+    walls = problem.walls
+    goal = problem.goal
+    costFn = getattr(problem, 'costFn', None)
+    if costFn != None:
+        costs = set([costFn((x, y)) for x in range(walls.width) for y in range(walls.height)
+                     if not walls[x][y]])
+        if costs - set([1]):
+            if min(costs) >= 1:
+                return aStarSearch(problem, lambda state, problem: util.manhattanDistance(state, goal))
+            return aStarSearch(problem)
+    pruned = 0
+
+    def isOpen(x, y):
+        return 0 <= x < walls.width and 0 <= y < walls.height and not walls[x][y]
+
+    def jump(x, y, dx, dy):
+        # Steps from (x, y) in direction (dx, dy) to the next jump point; None at a wall
+        nonlocal pruned
+        while True:
+            x, y = x + dx, y + dy
+            if not isOpen(x, y):
+                return None
+            if (x, y) == goal:
+                return (x, y)
+            if dx != 0:
+                if (isOpen(x, y - 1) and not isOpen(x - dx, y - 1)) or \
+                        (isOpen(x, y + 1) and not isOpen(x - dx, y + 1)):
+                    return (x, y)
+            else:
+                if (isOpen(x - 1, y) and not isOpen(x - 1, y - dy)) or \
+                        (isOpen(x + 1, y) and not isOpen(x + 1, y - dy)):
+                    return (x, y)
+                if jump(x, y, 1, 0) != None or jump(x, y, -1, 0) != None:
+                    return (x, y)
+            pruned += 1
+
+    start_state = problem.getStartState()
+    frontier = util.BucketQueue()
+    min_cost = {start_state: 0}
+    parents = {start_state: None} # jump point -> (previous jump point, direction)
+    frontier.push(start_state, util.manhattanDistance(start_state, goal))
+
+    while not frontier.isEmpty():
+        cur_state = frontier.pop()
+        if problem.isGoalState(cur_state):
+            actions = []
+            while parents[cur_state] != None:
+                previous_state, action = parents[cur_state]
+                actions.extend([action] * util.manhattanDistance(previous_state, cur_state))
+                cur_state = previous_state
+            actions.reverse()
+            problem._pruned = pruned
+            return actions
 
+        # Bookkeeping for display purposes
+        problem._expanded += 1
+        if cur_state not in problem._visited:
+            problem._visited[cur_state] = True
+            problem._visitedlist.append(cur_state)
+
+        # Go on straight or turn, but never back
+        x, y = cur_state
+        if parents[cur_state] == None:
+            directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+        elif x != parents[cur_state][0][0]:
+            dx = 1 if x > parents[cur_state][0][0] else -1
+            directions = [(dx, 0), (0, 1), (0, -1)]
+        else:
+            dy = 1 if y > parents[cur_state][0][1] else -1
+            directions = [(0, dy), (1, 0), (-1, 0)]
+
+        for dx, dy in directions:
+            succ_state = jump(x, y, dx, dy)
+            if succ_state == None:
+                continue
+            g_cost = min_cost[cur_state] + util.manhattanDistance(cur_state, succ_state)
+            if succ_state in min_cost and min_cost[succ_state] <= g_cost:
+                continue
+            min_cost[succ_state] = g_cost
+            parents[succ_state] = (cur_state, Actions.vectorToDirection((dx, dy)))
+            frontier.update(succ_state, g_cost + util.manhattanDistance(succ_state, goal))
+
+    problem._pruned = pruned
     return []
 
 def trackAStarSearch(problem: SearchProblem, heuristic=nullHeuristic) -> List[Directions]:
@@ -246,3 +530,6 @@ bfs = breadthFirstSearch
 dfs = depthFirstSearch
 astar = aStarSearch
 ucs = uniformCostSearch
+bibfs = bidirectionalBreadthFirstSearch
+biastar = bidirectionalAStarSearch
+jps = jumpPointSearch
@@ -28,10 +28,14 @@ from typing import List, Tuple, Any
 from game import Directions
 from game import Agent
 from game import Actions
+from game import BitGrid
 import util
 import time
 import search
 import pacman
+import distanceCalculator
+import pathAbstraction
+import incrementalSearch
 
 #######################################################
 # This portion is written for you, but will only work #
@@ -97,9 +101,11 @@ class SearchAgent(Agent):
         self.actions  = self.searchFunction(problem) # Find a path
         if self.actions == None:
             self.actions = []
+        if 'expandActions' in dir(problem): self.actions = problem.expandActions(self.actions)
         totalCost = problem.getCostOfActions(self.actions)
         print('Path found with total cost of %d in %.1f seconds' % (totalCost, time.time() - starttime))
         if '_expanded' in dir(problem): print('Search nodes expanded: %d' % problem._expanded)
+        if '_pruned' in dir(problem): print('Search nodes pruned: %d' % problem._pruned)
 
     def getAction(self, state):
         """
@@ -137,6 +143,7 @@ class PositionSearchProblem(search.SearchProblem):
         goal: A position in the gameState
         """
         self.walls = gameState.getWalls()
+        self.moves = gameState.getMoveTable()
         self.startState = gameState.getPacmanPosition()
         if start != None: self.startState = start
         self.goal = goal
@@ -177,14 +184,9 @@ class PositionSearchProblem(search.SearchProblem):
         """
 
         successors = []
-        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            x,y = state
-            dx, dy = Actions.directionToVector(action)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextState = (nextx, nexty)
-                cost = self.costFn(nextState)
-                successors.append( ( nextState, action, cost) )
+        for action, nextState in self.moves.getSuccessors(state):
+            cost = self.costFn(nextState)
+            successors.append( ( nextState, action, cost) )
 
         # Bookkeeping for display purposes
         self._expanded += 1 # DO NOT CHANGE
@@ -194,6 +196,26 @@ class PositionSearchProblem(search.SearchProblem):
 
         return successors
 
+    def getPredecessors(self, state):
+        """
+        Returns the positions one move away from state, the actions that lead
+        from them to state, and the cost of entering state: moves are
+        reversible.  Used by the bidirectional searches.
+        """
+
+        predecessors = []
+        cost = self.costFn(state)
+        for action, previousState in self.moves.getSuccessors(state):
+            predecessors.append( ( previousState, Actions.reverseDirection(action), cost) )
+
+        # A backward expansion is counted and shown like a forward one
+        self._expanded += 1
+        if state not in self._visited:
+            self._visited[state] = True
+            self._visitedlist.append(state)
+
+        return predecessors
+
     def getCostOfActions(self, actions):
         """
         Returns the cost of a particular sequence of actions. If those actions
@@ -210,6 +232,80 @@ class PositionSearchProblem(search.SearchProblem):
             cost += self.costFn((x,y))
         return cost
 
+class CorridorSearchProblem(PositionSearchProblem):
+    """
+    A PositionSearchProblem searched over the layout's CorridorGraph (see
+    game.py), so that a search expands junctions instead of every cell of
+    every corridor.
+
+    A state is still a position.  The successors of a junction are the
+    junctions at the far ends of its corridors, or the goal where it lies
+    along one; the successors of a start inside a corridor are the ends of
+    that corridor.  An action is a macro action: the tuple of Directions
+    along the way, whose cost is the sum of costFn over the cells entered.
+    expandActions turns a plan of macro actions into Directions, which
+    SearchAgent does for any problem that has it.  Macro actions take
+    different numbers of moves, so shortest plans need ucs or astar, not bfs.
+    """
+
+    def __init__(self, gameState, costFn = lambda x: 1, goal=(1,1), start=None, warn=True, visualize=True):
+        PositionSearchProblem.__init__(self, gameState, costFn, goal, start, warn, visualize)
+        self.corridors = gameState.getCorridorGraph()
+        self.graph = self.corridors.graph
+        self.edgeCosts = {} # (edge, first move, last move) -> cost
+
+        # The edges with the goal inside their corridor -> index of the goal along them
+        self.goalEdges = {}
+        goalId = self.graph.getId(goal)
+        if goalId != None and self.corridors.corridor[goalId] != None:
+            edge, index = self.corridors.corridor[goalId]
+            self.goalEdges[edge] = index
+            self.goalEdges[self.corridors.edgeReverse[edge]] = len(self.corridors.edgeCells[edge]) - 2 - index
+
+    def getSuccessors(self, state):
+        """
+        Returns successor states, the macro actions they require, and their
+        costs.
+        """
+
+        corridors = self.corridors
+        node = self.graph.getId(state)
+        if corridors.isJunction[node]:
+            runs = [(edge, 0) for edge in corridors.edges[node]]
+        else:
+            # The start, inside a corridor: head for both of its ends
+            edge, index = corridors.corridor[node]
+            reverse = corridors.edgeReverse[edge]
+            runs = [(edge, index + 1), (reverse, len(corridors.edgeCells[edge]) - 1 - index)]
+
+        successors = []
+        for edge, first in runs:
+            last = len(corridors.edgeCells[edge]) - 1
+            if self.goalEdges.get(edge, -1) >= first:
+                last = self.goalEdges[edge]
+            nextState = self.graph.getPosition(corridors.edgeCells[edge][last])
+            successors.append( ( nextState, corridors.edgeActions[edge][first:last + 1], self.getEdgeCost(edge, first, last)) )
+
+        # Only the junctions and goal cells a search stops at are shown expanded
+        self._expanded += 1
+        if state not in self._visited:
+            self._visited[state] = True
+            self._visitedlist.append(state)
+
+        return successors
+
+    def getEdgeCost(self, edge, first, last):
+        "The cost of the moves first to last along an edge of the CorridorGraph"
+        key = (edge, first, last)
+        if key not in self.edgeCosts:
+            cells = self.corridors.edgeCells[edge][first:last + 1]
+            self.edgeCosts[key] = sum([self.costFn(self.graph.getPosition(cell)) for cell in cells])
+        return self.edgeCosts[key]
+
+    def expandActions(self, actions):
+        "The Directions of a plan of macro actions"
+        return [direction for macroAction in actions for direction in macroAction]
+
 def manhattanHeuristic(position, problem, info={}):
     "The Manhattan distance heuristic for a PositionSearchProblem"
     xy1 = position
@@ -222,6 +318,27 @@ def euclideanHeuristic(position, problem, info={}):
     xy2 = problem.goal
     return ( (xy1[0] - xy2[0]) ** 2 + (xy1[1] - xy2[1]) ** 2 ) ** 0.5
 
+class HierarchicalSearchAgent(SearchAgent):
+    """
+    A SearchAgent for PositionSearchProblem that plans over the layout's
+    clusters and entrances (see pathAbstraction.py) instead of every cell,
+    for layouts too large for aStarSearch.  Its paths are close to, but not
+    always, the shortest.
+    """
+    def __init__(self, clusterSize=pathAbstraction.CLUSTER_SIZE):
+        self.clusterSize = int(clusterSize)
+        self.searchFunction = self.findPath
+        self.searchType = PositionSearchProblem
+
+    def registerInitialState(self, state):
+        self.abstraction = pathAbstraction.getAbstraction(state.data.layout, self.clusterSize)
+        SearchAgent.registerInitialState(self, state)
+
+    def findPath(self, problem):
+        actions = self.abstraction.findPath(problem.getStartState(), problem.goal)
+        problem._expanded = self.abstraction.expanded
+        return actions
+
 class FoodSearchProblem:
     """
     A search problem associated with finding the a path that collects all of the
@@ -234,6 +351,7 @@ class FoodSearchProblem:
     def __init__(self, startingGameState: pacman.GameState):
         self.start = (startingGameState.getPacmanPosition(), startingGameState.getFood())
         self.walls = startingGameState.getWalls()
+        self.moves = startingGameState.getMoveTable()
         self.startingGameState = startingGameState
         self._expanded = 0 # DO NOT CHANGE
         self.heuristicInfo = {} # A dictionary for the heuristic to store information
@@ -248,14 +366,11 @@ class FoodSearchProblem:
         "Returns successor states, the actions they require, and a cost of 1."
         successors = []
         self._expanded += 1 # DO NOT CHANGE
-        for direction in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            x,y = state[0]
-            dx, dy = Actions.directionToVector(direction)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextFood = state[1].copy()
-                nextFood[nextx][nexty] = False
-                successors.append( ( ((nextx, nexty), nextFood), direction, 1) )
+        x,y = state[0]
+        for direction, (nextx, nexty) in self.moves.getSuccessors((x, y)):
+            nextFood = state[1].copy()
+            nextFood[nextx][nexty] = False
+            successors.append( ( ((nextx, nexty), nextFood), direction, 1) )
         return successors
 
     def getCostOfActions(self, actions):
@@ -462,9 +577,13 @@ class ClosestDotSearchAgent(SearchAgent):
     "Search for all food using a sequence of searches"
     def registerInitialState(self, state):
         self.actions = []
+        self.foodDistances = None
+        self.fieldFood = None
         currentState = state
         while(currentState.getFood().count() > 0):
             nextPathSegment = self.findPathToClosestDot(currentState) # The missing piece
+            if len(nextPathSegment) == 0:
+                break # The rest of the food cannot be reached
             self.actions += nextPathSegment
             for action in nextPathSegment:
                 legal = currentState.getLegalActions()
@@ -483,11 +602,86 @@ class ClosestDotSearchAgent(SearchAgent):
         # Here are some useful elements of the startState
         startPosition = gameState.getPacmanPosition()
         food = gameState.getFood()
-        walls = gameState.getWalls()
-        problem = AnyFoodSearchProblem(gameState)
 
         "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        # One breadth first search from all the food gives every cell its
+        # distance to the closest dot; the path walks down those distances.
+        # The field is kept between segments, along with the food it was made
+        # for, and repaired around the dots eaten since
+        field = getattr(self, 'foodDistances', None)
+        fieldFood = getattr(self, 'fieldFood', None)
+        if field != None and field.layout is gameState.data.layout and \
+                food.bits & ~fieldFood.bits == 0:
+            eaten = BitGrid.fromBits(food.width, food.height, fieldFood.bits & ~food.bits)
+            for position in eaten.asList():
+                field.removeSource(position)
+        else:
+            field = self.foodDistances = distanceCalculator.DistanceField(gameState.data.layout, food.asList())
+        self.fieldFood = food
+        path = field.getPathToNearest(startPosition)
+        if path == None:
+            return []
+        return path
+
+class GhostAvoidingSearchAgent(Agent):
+    """
+    Heads for the corner of the board furthest from where Pacman starts,
+    planning again before every move: entering a cell within dangerRadius
+    moves of an unscared ghost costs dangerCost more, and the ghosts move
+    every turn.  One D* Lite planner (see incrementalSearch.py) is kept for
+    the whole game, so each plan only repairs the costs the ghosts' last
+    moves changed, and Pacman's own move, instead of searching again.
+
+    The goal stays fixed: only the costs change.  Replanning as the food is
+    eaten is ClosestDotSearchAgent's job, which repairs its DistanceField
+    around each eaten dot.
+    """
+    def __init__(self, dangerCost=20, dangerRadius=2):
+        self.dangerCost = int(dangerCost)
+        self.dangerRadius = int(dangerRadius)
+
+    def registerInitialState(self, state):
+        start = state.getPacmanPosition()
+        self.goal = state.data.layout.getFurthestCorner(start)
+        self.planner = incrementalSearch.DStarLite(state.data.layout, start, [self.goal])
+        self.costs = {}
+
+    def getDangerCosts(self, state):
+        "The cost of entering every cell near a ghost; the other cells cost 1"
+        moves = state.getMoveTable()
+        costs = {}
+        for ghostState in state.getGhostStates():
+            if ghostState.scaredTimer > 0:
+                continue
+            x, y = ghostState.getPosition()
+            ghost = (int(x + 0.5), int(y + 0.5))
+            distances = {ghost: 0}
+            frontier = [ghost]
+            for distance in range(1, self.dangerRadius + 1):
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbor in moves.getLegalNeighbors(cell):
+                        if neighbor not in distances:
+                            distances[neighbor] = distance
+                            nextFrontier.append(neighbor)
+                frontier = nextFrontier
+            for cell in distances:
+                costs[cell] = costs.get(cell, 1) + self.dangerCost
+        return costs
+
+    def getAction(self, state):
+        position = state.getPacmanPosition()
+        if position == self.goal:
+            return Directions.STOP
+        costs = self.getDangerCosts(state)
+        self.planner.moveStart(position)
+        for cell in set(self.costs) | set(costs):
+            self.planner.setCost(cell, costs.get(cell, 1))
+        self.costs = costs
+        action = self.planner.getNextAction()
+        if action == None:
+            return Directions.STOP
+        return action
 
 def mazeDistance(point1: Tuple[int, int], point2: Tuple[int, int], gameState: pacman.GameState) -> int:
     """
@@ -504,5 +698,9 @@ def mazeDistance(point1: Tuple[int, int], point2: Tuple[int, int], gameState: pa
     walls = gameState.getWalls()
     assert not walls[x1][y1], 'point1 is a wall: ' + str(point1)
     assert not walls[x2][y2], 'point2 is a wall: ' + str(point2)
-    prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
-    return len(search.bfs(prob))
+    # The layout's Distancer gives the length of the path bfs would find;
+    # like an empty bfs plan, no path at all counts as 0
+    distance = distanceCalculator.getDistancer(gameState.data.layout).getDistance(point1, point2)
+    if distance == None:
+        return 0
+    return distance
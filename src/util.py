@@ -208,39 +208,228 @@ class PriorityQueue:
     has a priority associated with it and the client is usually interested
     in quick retrieval of the lowest-priority item in the queue. This
     data structure allows O(1) access to the lowest-priority item.
+
+    The queue is an indexed binary heap: self.heap holds [priority, count,
+    item, position] entries, ties broken by count (first pushed, first
+    popped), and self.index maps every queued item to its entry, so that
+    'item in queue' is O(1) and update is an O(log n) decrease-key.
+
+    An item may be pushed more than once.  The heap then holds only the
+    entry of the item that will be popped first, and self.pending[item] is a
+    heap of the (priority, count) of its other pushes; popping the item puts
+    the next of them back into the heap.  Items need not be hashable, but
+    every push of an unhashable item is an entry of its own, and finding one
+    takes a scan of the heap.
     """
 
     def __init__(self):
         self.heap = []
         self.count = 0
+        self.index = {}
+        self.pending = {}
+        self.unhashable = 0   # number of entries with unhashable items
 
     def push(self, item, priority):
-        entry = (priority, self.count, item)
-        heapq.heappush(self.heap, entry)
+        count = self.count
         self.count += 1
+        try:
+            entry = self.index.get(item)
+        except TypeError:
+            self.unhashable += 1
+            self._insert([priority, count, item, 0])
+            return
+        if entry == None:
+            entry = self.index[item] = [priority, count, item, 0]
+            self._insert(entry)
+        elif priority < entry[0]:
+            # The new push is popped first: keep the queued one for later
+            heapq.heappush(self.pending.setdefault(item, []), (entry[0], entry[1]))
+            entry[0] = priority
+            entry[1] = count
+            self._siftUp(entry[3])
+        else:
+            heapq.heappush(self.pending.setdefault(item, []), (priority, count))
 
     def pop(self):
-        (_, _, item) = heapq.heappop(self.heap)
+        heap = self.heap
+        last = heap.pop()
+        if heap:
+            entry = heap[0]
+            heap[0] = last
+            last[3] = 0
+            self._siftDown(0)
+        else:
+            entry = last
+        item = entry[2]
+        try:
+            pending = self.pending.get(item)
+        except TypeError:
+            self.unhashable -= 1
+            return item
+        if pending == None:
+            del self.index[item]
+        else:
+            # Queue the item's next push in place of the popped one
+            entry[0], entry[1] = heapq.heappop(pending)
+            if len(pending) == 0:
+                del self.pending[item]
+            self._insert(entry)
         return item
 
     def isEmpty(self):
         return len(self.heap) == 0
 
+    def __contains__(self, item):
+        return self._find(item) != None
+
     def update(self, item, priority):
-        # If item already in priority queue with higher priority, update its priority and rebuild the heap.
+        # If item already in priority queue with higher priority, update its priority and move it up the heap.
         # If item already in priority queue with equal or lower priority, do nothing.
         # If item not in priority queue, do the same thing as self.push.
-        for index, (p, c, i) in enumerate(self.heap):
-            if i == item:
-                if p <= priority:
-                    break
-                del self.heap[index]
-                self.heap.append((priority, c, item))
-                heapq.heapify(self.heap)
+        entry = self._find(item)
+        if entry == None:
+            self.push(item, priority)
+        elif priority < entry[0]:
+            entry[0] = priority
+            self._siftUp(entry[3])
+
+    def _find(self, item):
+        """
+        Returns the first entry of item to be popped, or None if it is not
+        queued.
+        """
+        try:
+            return self.index.get(item)
+        except TypeError:
+            if self.unhashable == 0:
+                return None
+        entries = [entry for entry in self.heap if entry[2] == item]
+        if len(entries) == 0:
+            return None
+        return min(entries)
+
+    def _insert(self, entry):
+        entry[3] = len(self.heap)
+        self.heap.append(entry)
+        self._siftUp(entry[3])
+
+    def _siftUp(self, position):
+        heap = self.heap
+        entry = heap[position]
+        while position > 0:
+            parentPosition = (position - 1) >> 1
+            parent = heap[parentPosition]
+            if not entry < parent:
                 break
-        else:
+            heap[position] = parent
+            parent[3] = position
+            position = parentPosition
+        heap[position] = entry
+        entry[3] = position
+
+    def _siftDown(self, position):
+        heap = self.heap
+        size = len(heap)
+        entry = heap[position]
+        child = 2 * position + 1
+        while child < size:
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if not heap[child] < entry:
+                break
+            heap[position] = heap[child]
+            heap[position][3] = position
+            position = child
+            child = 2 * position + 1
+        heap[position] = entry
+        entry[3] = position
+
+
+class BucketQueue:
+    """
+    A priority queue for small non-negative integer priorities, such as the
+    path costs of a grid search (Dial's algorithm): self.buckets[p] lists
+    the items queued with priority p, and pop takes the last item pushed
+    into the lowest non-empty bucket.  Ties are thus broken last in, first
+    out, which favors the deeper nodes of a search.
+
+    Items must be hashable, and each is queued at most once: pushing a queued
+    item moves it to the new priority.  update and 'item in queue' work as
+    for PriorityQueue.  Moved items are left behind in their old bucket and
+    skipped when reached.
+
+    Given a priority that is not an int between 0 and MAX_PRIORITY, the queue
+    moves everything into a PriorityQueue, in the order it would have been
+    popped, and works as one from then on.
+    """
+
+    MAX_PRIORITY = 1 << 16
+
+    def __init__(self):
+        self.buckets = []
+        self.minimum = 0      # No bucket below this one holds a queued item
+        self.priorities = {}  # item -> priority of every queued item
+        self.queue = None     # The PriorityQueue, once the queue has moved into one
+
+    def push(self, item, priority):
+        if self.queue != None:
+            self.queue.push(item, priority)
+            return
+        if type(priority) != int or not 0 <= priority <= BucketQueue.MAX_PRIORITY:
+            self._moveToPriorityQueue()
+            self.queue.push(item, priority)
+            return
+        if priority >= len(self.buckets):
+            self.buckets.extend([[] for _ in range(priority + 1 - len(self.buckets))])
+        self.buckets[priority].append(item)
+        self.priorities[item] = priority
+        if priority < self.minimum:
+            self.minimum = priority
+
+    def pop(self):
+        if self.queue != None:
+            return self.queue.pop()
+        if len(self.priorities) == 0:
+            raise IndexError('pop from an empty BucketQueue')
+        buckets, priorities = self.buckets, self.priorities
+        while True:
+            bucket = buckets[self.minimum]
+            while bucket:
+                item = bucket.pop()
+                # The entry pushed last for an item is the one that counts
+                if priorities.get(item) == self.minimum:
+                    del priorities[item]
+                    return item
+            self.minimum += 1
+
+    def isEmpty(self):
+        if self.queue != None:
+            return self.queue.isEmpty()
+        return len(self.priorities) == 0
+
+    def __contains__(self, item):
+        if self.queue != None:
+            return item in self.queue
+        return item in self.priorities
+
+    def update(self, item, priority):
+        # If item already in priority queue with higher priority, update its priority.
+        # If item already in priority queue with equal or lower priority, do nothing.
+        # If item not in priority queue, do the same thing as self.push.
+        if self.queue != None:
+            self.queue.update(item, priority)
+        elif item not in self.priorities or priority < self.priorities[item]:
             self.push(item, priority)
 
+    def _moveToPriorityQueue(self):
+        queue = PriorityQueue()
+        while len(self.priorities) > 0:
+            item = self.pop()
+            queue.push(item, self.minimum)
+        self.queue = queue
+        self.buckets = None
+        self.priorities = None
+
 
 class PriorityQueueWithFunction(PriorityQueue):
     """
@@ -675,6 +864,7 @@ def pause():
 # this have all student code so wrapped.
 #
 import signal
+import threading
 import time
 
 
@@ -712,6 +902,130 @@ class TimeoutFunction:
         return result
 
 
+try:
+    import ctypes
+    _setAsyncExc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+except (ImportError, AttributeError):
+    _setAsyncExc = None
+
+
+def _interruptThread(threadId):
+    """
+    Raises TimeoutFunctionException in the given thread as soon as it next
+    runs Python code.  Returns False if this interpreter cannot do that.
+    """
+    if _setAsyncExc == None:
+        return False
+    threadId = ctypes.c_ulong(threadId)
+    count = _setAsyncExc(threadId, ctypes.py_object(TimeoutFunctionException))
+    if count > 1:
+        _setAsyncExc(threadId, None)
+        return False
+    return count == 1
+
+
+def _clearInterrupt(threadId):
+    """
+    Drops an exception _interruptThread raised in the given thread that has
+    not yet reached its Python code.
+    """
+    if _setAsyncExc != None:
+        _setAsyncExc(ctypes.c_ulong(threadId), None)
+
+
+class TimeBudget:
+    """
+    A move clock for one game, a replacement for TimeoutFunction that needs no
+    signals, works in any thread and takes fractional seconds.
+
+    call(seconds, function, ...) runs an agent method against a deadline on
+    the monotonic clock.  While it runs, the agent may ask for remainingMs()
+    and should call checkpoint() in long computations; checkpoint raises
+    TimeoutFunctionException once the deadline has passed.  Agents that never
+    check are interrupted by a single watchdog thread, started on the first
+    call and shared by every call of the game; where that is impossible the
+    overrun is reported when the function returns.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.deadline = None
+        self.threadId = None
+        self.watchdog = None
+        self.closed = False
+
+    def remainingMs(self):
+        """
+        Milliseconds left before the running call times out; infinite when
+        no call is being timed.
+        """
+        deadline = self.deadline
+        if deadline == None:
+            return float('inf')
+        return max(0.0, (deadline - time.monotonic()) * 1000.0)
+
+    def expired(self):
+        deadline = self.deadline
+        return deadline != None and time.monotonic() >= deadline
+
+    def checkpoint(self):
+        """
+        Raises TimeoutFunctionException if the running call is out of time.
+        """
+        if self.expired():
+            raise TimeoutFunctionException()
+
+    def call(self, seconds, function, *args, **keyArgs):
+        """
+        Calls function, raising TimeoutFunctionException if it takes longer
+        than seconds.  Calls may not be nested.
+        """
+        startTime = time.monotonic()
+        deadline = startTime + max(0.0, seconds)
+        with self.condition:
+            self.deadline = deadline
+            self.threadId = threading.get_ident()
+            if self.watchdog == None:
+                self.watchdog = threading.Thread(target=self._watch, daemon=True)
+                self.watchdog.start()
+            self.condition.notify()
+        try:
+            result = function(*args, **keyArgs)
+        finally:
+            # The watchdog only interrupts while holding the condition, so
+            # once the deadline is cleared it cannot interrupt this call any
+            # more.  An interruption it made just before may not have been
+            # raised yet; drop it so it cannot land in the caller instead.
+            with self.condition:
+                self.deadline = None
+            _clearInterrupt(self.threadId)
+        if time.monotonic() >= deadline:
+            raise TimeoutFunctionException()
+        return result
+
+    def close(self):
+        """
+        Stops the watchdog thread.
+        """
+        with self.condition:
+            self.closed = True
+            self.deadline = None
+            self.condition.notify()
+
+    def _watch(self):
+        with self.condition:
+            while not self.closed:
+                if self.deadline == None:
+                    self.condition.wait()
+                    continue
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                self.deadline = None
+                _interruptThread(self.threadId)
+
+
 _ORIGINAL_STDOUT = None
 _ORIGINAL_STDERR = None
 _MUTED = False